@@ -8,8 +8,9 @@ import processing
 import normalization
 import encoding
 import imputation
-import matplotlib.pyplot as plt
-import seaborn as sns
+import meta_features
+import instrumentation
+import report
 import random
 
 class AutoML():
@@ -45,6 +46,9 @@ class AutoML():
         #   subsets['y'] = ['class'] (headers of y columns)
         self.subsets = dict()
 
+        # Cache of the arrays returned by get_array, indexed by (subset, processed)
+        self.arrays = dict()
+
         # Column names
         self.feat_name = self.load_name(
             os.path.join(self.input_dir, self.basename + '_feat.name'))
@@ -149,6 +153,7 @@ class AutoML():
         return cls.from_df(input_dir, basename, X, y)
 
 
+    @instrumentation.instrument('AutoML.load')
     def init_data(self, test_size=0.2):
         """
             Load .data autoML files in a dictionary.
@@ -239,6 +244,7 @@ class AutoML():
         
         self.subsets['train'] = shuffled_index[split:]
         self.subsets['test'] = shuffled_index[:split]
+        self.arrays.clear()
 
 
     def load_data(self, filepath):
@@ -407,6 +413,43 @@ class AutoML():
             return data.as_matrix() #data.values
             
         return data
+
+    @property
+    def data(self):
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        # New DataFrame: the cached arrays are obsolete
+        self._data = data
+        self.arrays.clear()
+
+    @property
+    def processed_data(self):
+        return self._processed_data
+
+    @processed_data.setter
+    def processed_data(self, processed_data):
+        self._processed_data = processed_data
+        self.arrays.clear()
+
+    def get_array(self, s='', processed=False):
+        """
+            Return data as a float ndarray, computed once and cached.
+            The cache is cleared when the data is modified: assignment of data or processed_data,
+            set_data (used by the processing methods) and train_test_split.
+            In place modifications of the DataFrames must go through set_data.
+            The returned array is shared: please do not modify it in place.
+
+            :param s: Wanted set (X, y_train, all, etc.), see get_data.
+            :param processed: If True, the method returns processed data.
+            :return: The data.
+            :rtype: ndarray
+        """
+        if (s, processed) not in self.arrays:
+            data = self.get_data(s, processed=processed, verbose=False)
+            self.arrays[(s, processed)] = np.ascontiguousarray(data.values, dtype=np.float32)
+        return self.arrays[(s, processed)]
         
         
     def set_data(self, values, s='', processed=False):
@@ -435,6 +478,7 @@ class AutoML():
                 instances = self.subsets['test']
                 columns = self.data.columns.values
         
+        self.arrays.clear()
         if processed:
             self.processed_data.loc[instances, columns] = values
         else:
@@ -530,6 +574,7 @@ class AutoML():
             self.info['task'] = 'Unknown'
         return self.info['task']
 
+    @instrumentation.instrument('AutoML.process_data')
     def process_data(self, norm='standard', code='label', missing=['most', 'most', 'median']):
         """ 
             Preprocess data.
@@ -591,6 +636,7 @@ class AutoML():
         return imputed_data
 
     
+    @instrumentation.instrument('AutoML.imputation')
     def imputation(self, binary='most', categorical='most', numerical='median'):
         """
             Impute missing values.
@@ -619,6 +665,7 @@ class AutoML():
 
         return self.processed_data
 
+    @instrumentation.instrument('AutoML.normalization')
     def normalization(self, norm='standard'):
         """
             Normalize the data
@@ -649,6 +696,7 @@ class AutoML():
 
         return self.processed_data
 
+    @instrumentation.instrument('AutoML.encoding')
     def encoding(self, code='label'):
     
         train = self.get_data('X_train', processed=True, verbose=False)
@@ -680,7 +728,8 @@ class AutoML():
 
         return self.processed_data
 
-    def compute_descriptors(self, processed=False):
+    @instrumentation.instrument('AutoML.compute_descriptors')
+    def compute_descriptors(self, processed=False, landmarkers=False, n_jobs=1):
         """ 
             Compute descriptors of the dataset and store them in the descriptors dictionary.
             - ratio: Dataset ratio
@@ -690,23 +739,28 @@ class AutoML():
             - skewness_min: Minimum skewness over features 
             - skewness_max: Maximum skewness over features
             - skewness_mean: Average skewness over features
-        """ # - defective_proba: Probability of defective records (columns with missing values)
-        X = self.get_data('X', processed=processed)
-        
-        self.descriptors['ratio'] = int(self.info['feat_num']) / int(self.info['train_num'])
+            And the other meta-features of meta_features.compute_descriptors 
+            (moments, entropy, class imbalance, correlations, landmarkers).
             
-        self.descriptors['symb_ratio'] = list(self.feat_type).count('Numerical') / len(self.feat_type)
+            :param processed: If True, describe the processed data.
+            :param landmarkers: If True, compute the landmarkers (classification only, trains cross-validated models).
+            :param n_jobs: Number of jobs to run in parallel.
+        """
+        X, numeric = meta_features.to_array(self.get_data('X', processed=processed, verbose=False))
+        symbolic = np.array([t != 'Numerical' for t in self.feat_type], dtype=bool)
         
+        y = None
         if 'y' in self.subsets:
-            y = self.get_data('y')
-            self.descriptors['class_deviation'] = y.std().mean()
+            y, _ = meta_features.to_array(self.get_data('y'))
         
-        self.descriptors['missing_proba'] = (X.isnull().sum() / len(X)).mean()
+        self.descriptors['ratio'] = int(self.info['feat_num']) / int(self.info['train_num'])
             
-        skewness = X.skew()
-        self.descriptors['skewness_min'] = skewness.min()
-        self.descriptors['skewness_max'] = skewness.max()
-        self.descriptors['skewness_mean'] = skewness.mean()
+        self.descriptors['symb_ratio'] = list(self.feat_type).count('Numerical') / len(self.feat_type)
+        
+        self.descriptors.update(meta_features.compute_descriptors(
+            X, y, symbolic=symbolic, numeric=numeric,
+            classification='classification' in str(self.info.get('task', '')),
+            landmarkers=landmarkers, n_jobs=n_jobs))
     
 
     def show_info(self):
@@ -740,8 +794,9 @@ class AutoML():
             - skewness_min: Minimum skewness over features 
             - skewness_max: Maximum skewness over features
             - skewness_mean: Average skewness over features
+            - ... (see compute_descriptors method)
         """
-        self.compute_descriptors(processed=processed)
+        self.compute_descriptors(processed=processed, landmarkers=False)
         
         for k in list(self.descriptors.keys()):
             key = k.capitalize().replace('_', ' ')
@@ -751,12 +806,16 @@ class AutoML():
 
             print('{}: {}'.format(key, value))
             
-    def show_pairplot(self, s='', processed=False, max_features=20):
+    def show_pairplot(self, s='', processed=False, max_features=20, max_rows=None):
         feat_num = int(self.info['feat_num'])
         if feat_num < max_features: # TODO selection, plot with y
             sns.set(style="ticks")
             print('Pairplot of {} set'.format(s))
             data = self.get_data(s, processed)
+            # Downsampling: the pairplot cost grows with the number of points
+            if max_rows is not None and len(data) > max_rows:
+                print('Sample of {} rows out of {}'.format(max_rows, len(data)))
+                data = data.sample(max_rows, random_state=0)
             sns.pairplot(data) 
             plt.show()
         else:
@@ -767,11 +826,12 @@ class AutoML():
         data = self.get_data(s, processed)
         show_correlation(data)
     
-    def show_hierarchical_clustering(self, s='', processed=False):
+    def show_hierarchical_clustering(self, s='', processed=False, max_rows=None, reduce='sample'):
         print('Hierarchical clustering heatmap of {} set'.format(s))
         data = self.get_data(s, processed)
         # row_method, column_method, row_metric, column_metric, color_gradient
-        heatmap(data, 'average', 'single', 'euclidean', 'euclidean', 'coolwarm')
+        # Above max_rows rows, the rows are sampled or replaced by k-means centroids (reduce='kmeans')
+        heatmap(data, 'average', 'single', 'euclidean', 'euclidean', 'coolwarm', max_rows=max_rows, reduce=reduce)
     
     def show_classes(self, s='', processed=False):
         print('Classes distribution of {} set'.format(s))
@@ -788,13 +848,18 @@ class AutoML():
         else:
             print('Could not show PCA because X has {} rows and Y has {} rows'.format(lenx, leny))
         
-    def show_tsne(self, x='X', y='y', processed=False):
+    def show_tsne(self, x='X', y='y', processed=False, max_samples=None, n_components_pca=None, **kwargs):
+        """
+            :param max_samples: Maximum number of embedded rows (stratified subsample)
+            :param n_components_pca: Number of PCA components computed before T-SNE
+            :param kwargs: Additional parameters for utilities.compute_tsne and T-SNE (see sklearn doc)
+        """
         X = self.get_data(x, processed)
         Y = self.get_data(y, processed)
         lenx, leny = X.shape[0], Y.shape[0]
         if lenx == leny:
             print('t-distributed stochastic neighbor embedding of {} and {} sets'.format(x, y))
-            show_tsne(X, Y)
+            show_tsne(X, Y, max_samples=max_samples, n_components_pca=n_components_pca, **kwargs)
         else:
             print('Could not show t-SNE because X has {} rows and Y has {} rows'.format(lenx, leny))
         
@@ -863,6 +928,20 @@ class AutoML():
                 self.show_lda(x_sets[i], y_sets[i], processed)
                 
        
+    def report(self, out_dir, njobs=None, embed=False, cache_dir=None, **kwargs):
+        """
+            Write the characteristics of the dataset (see show_characteristics) in an HTML report,
+            without display: the plots are rendered in worker processes (Agg backend).
+
+            :param out_dir: Output directory (index.html and PNG files)
+            :param njobs: Number of worker processes. Default: number of CPUs.
+            :param embed: If True, the images are embedded in the HTML file
+            :param cache_dir: Directory of the T-SNE embeddings, reused by the next reports (None: no reuse)
+            :param kwargs: Parameters of report.automl_tasks (sets, processed, max_features, max_rows, n_components_pca)
+            :return: Path of the HTML file
+        """
+        return report.automl_report(self, out_dir, njobs=njobs, embed=embed, cache_dir=cache_dir, **kwargs)
+
     def choose_sets(self, sets=[]):
         """ 
             Return sets for plot
@@ -1,11 +1,13 @@
 # Imports
 from utilities import *
 from scipy.stats import ttest_ind
-from IPython.display import display
 from metric import *
 from sklearn.linear_model import LogisticRegression
 import random
 from encoding import frequency
+import tstr
+import instrumentation
+import report
 
 class Comparator():
     def __init__(self, ds1, ds2):
@@ -73,6 +75,7 @@ class Comparator():
         """
         return ttest_ind(self.ds1.get_data('X'), self.ds2.get_data('X'))
          
+    @instrumentation.instrument('Comparator.compute_descriptors')
     def compute_descriptors(self, norm='manhattan', processed=False):
         """ 
             Compute distances between descriptors of ds1 and ds2.
@@ -92,6 +95,7 @@ class Comparator():
                 # Distance
                 self.descriptors_dist[k] = distance(descriptors1[k], descriptors2[k], norm=norm)
             
+    @instrumentation.instrument('Comparator.compute_comparison_matrix')
     def compute_comparison_matrix(self):
         """ 
             Compute a pandas DataFrame
@@ -119,6 +123,7 @@ class Comparator():
                 self.comparison_matrix.at['Jensen-Shannon divergence', column] = jensen_shannon(f1, f2)
                 #self.comparison_matrix.at['Chi-square', column] = chi_square(f1, f2)
                 
+    @instrumentation.instrument('Comparator.classify')
     def classify(self, clf=LogisticRegression()):
         """ Return the score (mean accuracy) of a classifier train on the data labeled with 0 or 1 according to their original dataset.
             
@@ -165,6 +170,17 @@ class Comparator():
         printmd('** Score: **' + str(score))
         print('\n')
           
+    @instrumentation.instrument('Comparator.utility')
+    def utility(self, **kwargs):
+        """ Utility of ds2 as a synthetic version of ds1: scores of models trained on ds2 (TSTR) or on the train set of ds1 (TRTR),
+            tested on the test set of ds1.
+
+            :param kwargs: Parameters of tstr.utility (models, target, task, njobs, tmp_dir)
+            :return: Score and wall-clock time of each model and training set
+            :rtype: pd.DataFrame
+        """
+        return tstr.utility(self.ds1, self.ds2, **kwargs)
+
     def show_descriptors(self):
         """ Show descriptors distances between ds1 and ds2.
         """
@@ -182,6 +198,7 @@ class Comparator():
         display(self.comparison_matrix)
 
 
+    @instrumentation.instrument('Comparator.compute_mda')
     def compute_mda(self, norm='manhattan', precision=0.2, threshold=None, area='simpson'):
         """ Compute the accumulation of minimum distances from one dataset to other.
             Use for privacy/resemblance metrics.
@@ -240,6 +257,17 @@ class Comparator():
         printmd('** Resemblance:** ' + str(resemblanceB))
         
      
+    def report(self, out_dir, njobs=None, embed=False):
+        """ Write the comparison (descriptors, comparison matrix, classifier score, MDA) in an HTML report,
+            without display: the plots are rendered in worker processes (Agg backend).
+
+            :param out_dir: Output directory (index.html and PNG files)
+            :param njobs: Number of worker processes. Default: number of CPUs.
+            :param embed: If True, the images are embedded in the HTML file
+            :return: Path of the HTML file
+        """
+        return report.comparator_report(self, out_dir, njobs=njobs, embed=embed)
+
     def show_mmd(self):
         """ Compute and show MMD between ds1 and ds2
         """
@@ -0,0 +1,126 @@
+# Utility of synthetic data: train on synthetic or real data, test on real data (TSTR / TRTR).
+# The models are fitted concurrently in a process pool. Datasets are written once
+# as .npy files and memory-mapped by the workers, so they are not copied for each task.
+
+# Imports
+import os
+import time
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.base import clone
+from sklearn.linear_model import LogisticRegression, Ridge
+from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
+from sklearn.neighbors import KNeighborsClassifier, KNeighborsRegressor
+from sklearn.tree import DecisionTreeClassifier, DecisionTreeRegressor
+
+# Default suite of models, by task
+CLASSIFIERS = {'logistic_regression': LogisticRegression(max_iter=1000),
+               'decision_tree': DecisionTreeClassifier(),
+               'random_forest': RandomForestClassifier(n_estimators=100),
+               'knn': KNeighborsClassifier()}
+
+REGRESSORS = {'ridge': Ridge(),
+              'decision_tree': DecisionTreeRegressor(),
+              'random_forest': RandomForestRegressor(n_estimators=100),
+              'knn': KNeighborsRegressor()}
+
+
+def split_target(ds, target=None, features=None, s=''):
+    """
+        Split an AutoML dataset into features and target.
+
+        :param ds: AutoML object
+        :param target: Name of the target column (in X or y). None for the y columns of ds.
+        :param features: Names of the feature columns. None for all the other columns of ds.
+        :param s: Wanted set ('', 'train', 'test')
+        :return: Tuple (X, y, features), y being a vector (argmax of one-hot labels)
+        :rtype: Tuple
+    """
+    data = ds.get_data(s, processed=True, verbose=False)
+    if target is None:
+        if 'y' not in ds.subsets:
+            raise ValueError('Argument target is invalid: the dataset has no label.')
+        target = list(ds.subsets['y'])
+    else:
+        target = [target]
+    if features is None:
+        features = [column for column in data.columns if column not in target]
+
+    y = np.asarray(data[target].values, dtype=np.float64)
+    y = y.argmax(axis=1) if y.shape[1] > 1 else y[:, 0]
+    return np.asarray(data[features].values, dtype=np.float64), y, features
+
+
+def _save(directory, name, X, y):
+    """ Write a dataset in .npy files and return their paths.
+    """
+    paths = (os.path.join(directory, name + '_X.npy'), os.path.join(directory, name + '_y.npy'))
+    np.save(paths[0], np.ascontiguousarray(X))
+    np.save(paths[1], np.ascontiguousarray(y))
+    return paths
+
+
+def _fit_score(model, train, test):
+    """ Fit a model on the train set and score it on the test set (memory-mapped .npy files).
+    """
+    X_train, y_train = (np.load(path, mmap_mode='r') for path in train)
+    X_test, y_test = (np.load(path, mmap_mode='r') for path in test)
+    start = time.time()
+    model.fit(X_train, y_train)
+    score = model.score(X_test, y_test)
+    return score, time.time() - start
+
+
+def utility(real, synthetic, models=None, target=None, task=None, njobs=None, tmp_dir=None):
+    """
+        Train on Synthetic, Test on Real (TSTR) and Train on Real, Test on Real (TRTR).
+        Each model is fitted on the train set of the real data and on each synthetic dataset,
+        and scored on the test set of the real data.
+        Datasets should be processed (see AutoML.process_data).
+
+        :param real: AutoML object of the real data
+        :param synthetic: AutoML object, or dictionary {name: AutoML object} of synthetic releases
+        :param models: Dictionary {name: estimator} of models with fit(X, y) and score(X, y) methods.
+                       Default: CLASSIFIERS or REGRESSORS, according to the task.
+        :param target: Name of the target column (in X or y). None for the y columns of the real data.
+        :param task: 'classification' or 'regression'. None to infer it from the target.
+        :param njobs: Number of worker processes. None for the number of processors.
+        :param tmp_dir: Directory of the memory-mapped arrays (removed at the end). None for a temporary directory.
+        :return: Score (accuracy or R2) and wall-clock time (fit and score) of each model and training set.
+                 Columns: train (real or name of the synthetic release), model, score, time.
+        :rtype: pd.DataFrame
+    """
+    if not isinstance(synthetic, dict):
+        synthetic = {'synthetic': synthetic}
+
+    X_train, y_train, features = split_target(real, target, s='train')
+    X_test, y_test, _ = split_target(real, target, features=features, s='test')
+
+    if task is None:
+        # Same rule as AutoML.get_type_problem
+        y = np.concatenate([y_train, y_test])
+        task = 'classification' if len(np.unique(y)) < len(y) / 8 else 'regression'
+    if task not in ['classification', 'regression']:
+        raise ValueError('Argument task is invalid.')
+    if models is None:
+        models = CLASSIFIERS if task == 'classification' else REGRESSORS
+
+    directory = tempfile.mkdtemp(dir=tmp_dir)
+    try:
+        test = _save(directory, 'test', X_test, y_test)
+        trains = {'real': _save(directory, 'real', X_train, y_train)}
+        for i, (name, ds) in enumerate(synthetic.items()):
+            X, y, _ = split_target(ds, target, features=features)
+            trains[name] = _save(directory, 'synthetic_{}'.format(i), X, y)
+
+        with ProcessPoolExecutor(max_workers=njobs) as executor:
+            futures = {(name, model_name): executor.submit(_fit_score, clone(model), train, test)
+                       for name, train in trains.items() for model_name, model in models.items()}
+            results = [(name, model_name) + future.result() for (name, model_name), future in futures.items()]
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    return pd.DataFrame(results, columns=['train', 'model', 'score', 'time'])
@@ -0,0 +1,258 @@
+# Benchmark of the data generators (RF_generator, copula, SAM, medGAN).
+# Each generator is run on the bundled datasets at several scale factors (row replication).
+# Fit time, sampling throughput, peak memory (RSS) and Comparator quality scores are written
+# to a JSON file, so that runs can be diffed over time.
+#
+# Usage (from the repository root):
+#   python code/benchmarks/bench_generators.py --generators copula sam --scales 1 2 4 --out bench.json
+#   python code/benchmarks/bench_generators.py --baseline bench_old.json --out bench_new.json
+
+# Imports
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import shutil
+import subprocess
+import tempfile
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+for problem_dir in ['code/auto_ml', 'code/processing', 'code/functions', 'code/models', 'code/generators']:
+    if os.path.join(ROOT, problem_dir) not in sys.path:
+        sys.path.append(os.path.join(ROOT, problem_dir))
+
+
+def load_automl(name):
+    from auto_ml import AutoML
+    return AutoML(os.path.join(ROOT, 'data', name), name).get_data('X')
+
+
+# Bundled datasets: name -> function returning the features as a DataFrame
+DATASETS = {'iris': lambda: load_automl('iris'),
+            'diabetes': lambda: load_automl('diabetes'),
+            'mushrooms': lambda: load_automl('mushrooms'),
+            'wine': lambda: load_automl('wine'),
+            'squares': lambda: pd.read_csv(os.path.join(ROOT, 'data', 'squares', 'squares.csv'),
+                                           header=None).add_prefix('X'),
+            'adult': lambda: pd.read_csv(os.path.join(ROOT, 'data', 'adult', 'adult.data'),
+                                         header=None, skipinitialspace=True).add_prefix('X')}
+
+
+def run_rf(ds, n, config):
+    from rf_generator import RF_generator
+    start = time.time()
+    generator = RF_generator(ds)
+    generator.fit(n_estimators=config['rf_estimators'])
+    fit_time = time.time() - start
+    start = time.time()
+    # The RF generator imputes the rows of the dataset: n is the number of rows
+    X = generator.generate(p=0.8)
+    return fit_time, time.time() - start, X
+
+
+def run_copula(ds, n, config):
+    from copula_generator import CopulaGenerator
+    X = ds.get_data('X', processed=True)
+    start = time.time()
+    generator = CopulaGenerator(method=config['copula_method']).fit(X)
+    fit_time = time.time() - start
+    start = time.time()
+    X = generator.sample(n)
+    return fit_time, time.time() - start, X
+
+
+def run_sam(ds, n, config):
+    from csam import SAM
+    X = ds.get_data('X', processed=True)
+    categorical_variables = [t != 'Numerical' for t in ds.feat_type]
+    start = time.time()
+    generator = SAM(train_epochs=config['epochs'], test_epochs=config['test_epochs'])
+    generator.run_SAM(X, categorical_variables=categorical_variables, verbose=False)
+    fit_time = time.time() - start
+    start = time.time()
+    X = pd.concat(generator.generate_batches(n, batch_size=10000))
+    return fit_time, time.time() - start, X
+
+
+def run_medgan(ds, n, config):
+    from medgan_torch import Medgan
+    # Non negative data for the 'count' data type
+    ds.process_data(norm='min-max')
+    X = ds.get_data('X', processed=True)
+    start = time.time()
+    generator = Medgan(dataType='count', inputDim=X.shape[1], device='cpu')
+    generator.train(dataPath=ds, outPath=os.path.join(config['work_dir'], 'medgan'),
+                    nEpochs=config['epochs'], pretrainEpochs=config['test_epochs'],
+                    saveEvery=0, validPeriod=0)
+    fit_time = time.time() - start
+    start = time.time()
+    outFile = generator.generateData(nSamples=n, modelFile=None, batchSize=1000, burnIn=config['burn_in'],
+                                     outFile=os.path.join(config['work_dir'], 'medgan_generated.npy'))
+    X = pd.DataFrame(np.load(outFile), columns=X.columns)
+    return fit_time, time.time() - start, X
+
+
+GENERATORS = {'rf': run_rf,
+              'copula': run_copula,
+              'sam': run_sam,
+              'medgan': run_medgan}
+
+
+def quality(ds, X):
+    """ Comparator scores between a dataset and its generated version.
+        - discriminator_accuracy: accuracy of a classifier separating real and generated rows (0.5 is best)
+        - descriptors_distance: mean distance between the descriptors of the two datasets
+        The generators are fitted on the processed data: the reference is the processed data
+        (as given to the generator), so that both datasets are in the same space.
+    """
+    from auto_ml import AutoML
+    from comparator import Comparator
+    input_dir = ds.input_dir.rsplit('/', 1)[0]
+    reference = AutoML.from_df(input_dir, ds.basename + '_ref',
+                               ds.get_data('X', processed=True).reset_index(drop=True))
+    gen = AutoML.from_df(input_dir, ds.basename + '_gen', X.reset_index(drop=True))
+    comparator = Comparator(reference, gen)
+    return {'discriminator_accuracy': float(comparator.classify()),
+            'descriptors_distance': float(np.nanmean(list(comparator.descriptors_dist.values())))}
+
+
+def run(dataset, generator, scale, config):
+    """
+        Run a generator on a scaled dataset. Called in a fresh process, so that
+        the peak RSS (ru_maxrss) is the one of this run only.
+
+        :return: Record of the run
+        :rtype: dict
+    """
+    from auto_ml import AutoML
+    record = {'dataset': dataset, 'generator': generator, 'scale': scale}
+    work_dir = tempfile.mkdtemp(dir=config['work_dir'])
+    config = dict(config, work_dir=work_dir)
+    try:
+        X = DATASETS[dataset]()
+        X = pd.concat([X] * scale, ignore_index=True)
+        ds = AutoML.from_df(work_dir, '{}_x{}'.format(dataset, scale), X)
+        ds.process_data()
+        record['rows'], record['columns'] = X.shape
+
+        fit_time, sample_time, X_gen = GENERATORS[generator](ds, len(X), config)
+        record['fit_time'] = fit_time
+        record['sample_time'] = sample_time
+        record['rows_per_sec'] = len(X_gen) / max(sample_time, 1e-9)
+    except Exception:
+        record['error'] = traceback.format_exc(limit=3)
+    else:
+        if config['quality']:
+            # Timings are kept if the comparison fails
+            try:
+                record.update(quality(ds, X_gen))
+            except Exception:
+                record['quality_error'] = traceback.format_exc(limit=3)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    # Kilobytes on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    record['peak_rss_mb'] = rss / 1024 ** (2 if sys.platform == 'darwin' else 1)
+    return record
+
+
+def metadata():
+    """ Environment of the run, to interpret diffs between runs. """
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'commit': commit,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__}
+
+
+def compare(records, baseline, threshold=0.2):
+    """
+        Print the runs whose time or memory increased by more than threshold (relative) compared to a baseline.
+
+        :return: List of regressions (dataset, generator, scale, metric, old value, new value)
+        :rtype: list
+    """
+    key = lambda r: (r['dataset'], r['generator'], r['scale'])
+    old = {key(r): r for r in baseline['results']}
+    regressions = []
+    for r in records:
+        if key(r) not in old:
+            continue
+        for metric in ['fit_time', 'sample_time', 'peak_rss_mb']:
+            a, b = old[key(r)].get(metric), r.get(metric)
+            if a and b and b > a * (1 + threshold):
+                regressions.append(key(r) + (metric, a, b))
+                print('Regression: {} {} x{} {}: {:.3f} -> {:.3f}'.format(*regressions[-1]))
+    return regressions
+
+
+def parse_arguments(parser):
+    parser.add_argument('--datasets', nargs='+', default=list(DATASETS), choices=list(DATASETS),
+                        help='Datasets to benchmark. (default: all)')
+    parser.add_argument('--generators', nargs='+', default=list(GENERATORS), choices=list(GENERATORS),
+                        help='Generators to benchmark. (default: all)')
+    parser.add_argument('--scales', nargs='+', type=int, default=[1, 2, 4],
+                        help='Scale factors (row replication). (default: 1 2 4)')
+    parser.add_argument('--epochs', type=int, default=50,
+                        help='Training epochs of SAM and medGAN. (default: 50)')
+    parser.add_argument('--test_epochs', type=int, default=10,
+                        help='Test epochs of SAM, pretraining epochs of medGAN. (default: 10)')
+    parser.add_argument('--rf_estimators', type=int, default=10,
+                        help='Number of trees of the RF generator. (default: 10)')
+    parser.add_argument('--copula_method', default='gaussian', choices=['gaussian', 'kde'],
+                        help='Latent model of the copula generator. (default: gaussian)')
+    parser.add_argument('--burn_in', type=int, default=100,
+                        help='Burn-in batches of medGAN before sampling (included in the sampling time). (default: 100)')
+    parser.add_argument('--no_quality', action='store_true',
+                        help='Skip the Comparator quality scores.')
+    parser.add_argument('--out', default='bench_generators.json',
+                        help='Output JSON file. (default: bench_generators.json)')
+    parser.add_argument('--baseline', default=None,
+                        help='Previous output JSON file, to report regressions.')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative increase reported as a regression. (default: 0.2)')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments(argparse.ArgumentParser())
+    config = {'epochs': args.epochs, 'test_epochs': args.test_epochs, 'rf_estimators': args.rf_estimators,
+              'copula_method': args.copula_method, 'burn_in': args.burn_in, 'quality': not args.no_quality}
+    config['work_dir'] = tempfile.mkdtemp()
+
+    records = []
+    # One fresh process per run: isolated peak RSS
+    context = multiprocessing.get_context('spawn')
+    try:
+        for dataset in args.datasets:
+            for generator in args.generators:
+                for scale in args.scales:
+                    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                        record = executor.submit(run, dataset, generator, scale, config).result()
+                    records.append(record)
+                    print('{dataset} {generator} x{scale}: '.format(**record) +
+                          ('error' if 'error' in record else
+                           'fit {fit_time:.2f}s, {rows_per_sec:.0f} rows/s, {peak_rss_mb:.0f} MB'.format(**record)))
+    finally:
+        shutil.rmtree(config.pop('work_dir'), ignore_errors=True)
+
+    with open(args.out, 'w') as f:
+        json.dump({'metadata': metadata(), 'config': config, 'results': records}, f, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            compare(records, json.load(f), threshold=args.threshold)
@@ -0,0 +1,113 @@
+# Import time regression check of the compute modules (auto_ml, comparator, utilities, metric, processing).
+# Each module is imported in a fresh interpreter: import time, peak memory (RSS) and the heavy
+# modules loaded (plotting, IPython, torch) are recorded. The compute paths must not load them:
+# they are imported lazily on first use (see utilities._LazyModule).
+# The exit status is 1 if a heavy module is loaded, or if the import time exceeds --max_time
+# or increased by more than --threshold compared to a baseline.
+#
+# Usage (from the repository root):
+#   python code/benchmarks/bench_imports.py --out bench_imports.json
+#   python code/benchmarks/bench_imports.py --baseline bench_imports_old.json
+
+# Imports
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+PATHS = [os.path.join(ROOT, problem_dir) for problem_dir in
+         ['code/auto_ml', 'code/processing', 'code/functions', 'code/models']]
+
+# Compute modules checked by default
+MODULES = ['auto_ml', 'comparator', 'utilities', 'metric', 'processing']
+
+# Modules that must be imported lazily
+HEAVY = ['torch', 'matplotlib', 'seaborn', 'IPython', 'sklearn.manifold']
+
+# Code run in the fresh interpreter
+SCRIPT = '''
+import sys, time, json, resource
+sys.path[:0] = {paths!r}
+start = time.perf_counter()
+import {module}
+duration = time.perf_counter() - start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 ** (2 if sys.platform == 'darwin' else 1)
+print(json.dumps({{'time': duration, 'peak_rss_mb': rss,
+                   'heavy': [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+
+def measure(module, repeat=3):
+    """
+        Import a module in fresh interpreters.
+
+        :param module: Name of the module
+        :param repeat: Number of runs (the best time is kept)
+        :return: Record: best import time (s), peak RSS (MB), heavy modules loaded
+        :rtype: dict
+    """
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, '-c',
+                                          SCRIPT.format(paths=PATHS, module=module, heavy=HEAVY)], cwd=ROOT)
+        runs.append(json.loads(output.decode().strip().splitlines()[-1]))
+    best = min(runs, key=lambda r: r['time'])
+    return {'module': module, 'time': best['time'], 'peak_rss_mb': best['peak_rss_mb'], 'heavy': best['heavy']}
+
+
+def check(records, max_time=None, baseline=None, threshold=0.2):
+    """
+        :return: List of failures (messages)
+        :rtype: list
+    """
+    old = {r['module']: r for r in baseline['results']} if baseline is not None else dict()
+    failures = []
+    for r in records:
+        if r['heavy']:
+            failures.append('{}: imports {}'.format(r['module'], ', '.join(r['heavy'])))
+        if max_time is not None and r['time'] > max_time:
+            failures.append('{}: {:.2f}s > {:.2f}s'.format(r['module'], r['time'], max_time))
+        if r['module'] in old and r['time'] > old[r['module']]['time'] * (1 + threshold):
+            failures.append('{}: {:.2f}s -> {:.2f}s'.format(r['module'], old[r['module']]['time'], r['time']))
+    return failures
+
+
+def parse_arguments(parser):
+    parser.add_argument('--modules', nargs='+', default=MODULES,
+                        help='Modules to import. (default: {})'.format(' '.join(MODULES)))
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of runs (the best is kept). (default: 3)')
+    parser.add_argument('--max_time', type=float, default=None,
+                        help='Maximum import time in seconds. (default: none)')
+    parser.add_argument('--out', default=None,
+                        help='Output JSON file. (default: none)')
+    parser.add_argument('--baseline', default=None,
+                        help='Previous output JSON file, to report regressions.')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='Relative increase reported as a regression. (default: 0.2)')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments(argparse.ArgumentParser())
+
+    records = []
+    for module in args.modules:
+        records.append(measure(module, repeat=args.repeat))
+        print('{module:12s} {time:.3f}s {peak_rss_mb:.0f} MB'.format(**records[-1]) +
+              ('  heavy: ' + ', '.join(records[-1]['heavy']) if records[-1]['heavy'] else ''))
+
+    if args.out is not None:
+        with open(args.out, 'w') as f:
+            json.dump({'results': records}, f, indent=2)
+
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    failures = check(records, max_time=args.max_time, baseline=baseline, threshold=args.threshold)
+    for failure in failures:
+        print('FAIL ' + failure)
+    sys.exit(1 if failures else 0)
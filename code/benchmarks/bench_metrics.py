@@ -0,0 +1,187 @@
+# Micro-benchmark of the metrics of functions/metric.py and functions/utilities.py.
+# Each metric is run on synthetic data for a sweep of n (rows) and d (features).
+# Time and peak memory (tracemalloc: numpy allocations, not torch) are recorded,
+# the growth exponent in n is estimated (log-log slope) and quadratic blowups are flagged.
+# Optimized paths are checked against naive reference implementations.
+#
+# Usage (from the repository root):
+#   python code/benchmarks/bench_metrics.py --n 250 500 1000 2000 --d 5 20 80 --out bench_metrics.json
+
+# Imports
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+for problem_dir in ['code/functions', 'code/processing']:
+    if os.path.join(ROOT, problem_dir) not in sys.path:
+        sys.path.append(os.path.join(ROOT, problem_dir))
+
+import metric
+import utilities
+
+# Metrics: name -> function of two samples A (n, d) and B (n, d)
+METRICS = {'distance_correlation': metric.distance_correlation,
+           'relief_divergence': metric.relief_divergence,
+           'nn_discrepancy': metric.nn_discrepancy,
+           'ks_test': metric.ks_test,
+           'cov_discrepancy': metric.cov_discrepancy,
+           'corr_discrepancy': metric.corr_discrepancy,
+           'minimum_distance': utilities.minimum_distance,
+           'compute_mda': lambda A, B: utilities.compute_mda(utilities.minimum_distance(A, B)[0],
+                                                             precision=0.05, threshold=0.2),
+           'mmd': lambda A, B: utilities.mmd(A, B).item()}
+
+
+def reference_minimum_distance(A, B, norm='manhattan'):
+    """ Naive minimum distances (previous implementation of utilities.minimum_distance). """
+    mdA = [None for _ in range(len(A))]
+    mdB = [None for _ in range(len(B))]
+    for i in range(len(A)):
+        for j in range(len(B)):
+            d = metric.distance(A[i], B[j], norm=norm)
+            if mdA[i] == None or mdA[i] > d:
+                mdA[i] = d
+            if mdB[j] == None or mdB[j] > d:
+                mdB[j] = d
+    return mdA, mdB
+
+
+def reference_mda_counts(md, x):
+    """ Naive number of minimum distances lower than each x (previous loop of utilities.compute_mda). """
+    return [sum(1 for i in md if i < e) for e in x]
+
+
+def check_references(n=60, d=4, seed=0):
+    """
+        Compare the optimized paths with the reference implementations on small data.
+
+        :return: Dictionary {check: True if outputs match}
+        :rtype: dict
+    """
+    random_state = np.random.RandomState(seed)
+    A, B = random_state.normal(size=(n, d)), random_state.normal(size=(n + 7, d))
+    # Integer data, so that the 'l0' norm has ties
+    Ai, Bi = random_state.randint(0, 3, size=(n, d)).astype(float), random_state.randint(0, 3, size=(n, d)).astype(float)
+
+    checks = dict()
+    for norm in ['manhattan', 'euclidean', 'minimum', 'maximum', 'l0']:
+        X, Y = (Ai, Bi) if norm == 'l0' else (A, B)
+        optimized = utilities.minimum_distance(X, Y, norm=norm, block_size=16)
+        reference = reference_minimum_distance(X, Y, norm=norm)
+        checks['minimum_distance_' + norm] = all(np.allclose(o, r) for o, r in zip(optimized, reference))
+
+    md = utilities.minimum_distance(A, B)[0]
+    x = np.arange(0, max(max(md), 1), 0.05)
+    checks['compute_mda_counts'] = np.array_equal(np.searchsorted(np.sort(md), x, side='left'),
+                                                  reference_mda_counts(md, x))
+    return checks
+
+
+def measure(f, A, B, repeat=3):
+    """
+        :return: Tuple (best time in seconds, peak memory in MB)
+        :rtype: Tuple
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        f(A, B)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    f(A, B)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak / 2 ** 20
+
+
+def slope(x, y):
+    """ Growth exponent: slope of log(y) against log(x). """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    keep = y > 0
+    if keep.sum() < 2:
+        return None
+    return float(np.polyfit(np.log(x[keep]), np.log(y[keep]), 1)[0])
+
+
+def run(metrics, ns, ds, n_fixed, d_fixed, repeat=3, threshold=1.5, seed=0):
+    """
+        Sweep n (with d = d_fixed) and d (with n = n_fixed) for each metric.
+
+        :param threshold: Growth exponent in n above which a metric is flagged as quadratic
+        :return: Results: measures of each run and growth exponents of each metric
+        :rtype: dict
+    """
+    random_state = np.random.RandomState(seed)
+    runs = []
+    summary = dict()
+    for name in metrics:
+        f = METRICS[name]
+        sweep = [(n, d_fixed) for n in ns] + [(n_fixed, d) for d in ds if (n_fixed, d) not in [(n, d_fixed) for n in ns]]
+        measures = []
+        for n, d in sweep:
+            A, B = random_state.normal(size=(n, d)), random_state.normal(loc=0.1, size=(n, d))
+            try:
+                t, memory = measure(f, A, B, repeat=repeat)
+            except Exception as e:
+                runs.append({'metric': name, 'n': n, 'd': d, 'error': repr(e)})
+                print('{metric} n={n} d={d}: {error}'.format(**runs[-1]))
+                continue
+            measures.append({'metric': name, 'n': n, 'd': d, 'time': t, 'memory_mb': memory})
+            print('{metric} n={n} d={d}: {time:.4f}s {memory_mb:.1f}MB'.format(**measures[-1]))
+        runs += measures
+
+        in_n = [m for m in measures if m['d'] == d_fixed]
+        in_d = [m for m in measures if m['n'] == n_fixed]
+        summary[name] = {'time_exponent_n': slope([m['n'] for m in in_n], [m['time'] for m in in_n]),
+                         'memory_exponent_n': slope([m['n'] for m in in_n], [m['memory_mb'] for m in in_n]),
+                         'time_exponent_d': slope([m['d'] for m in in_d], [m['time'] for m in in_d])}
+        summary[name]['quadratic'] = any(e is not None and e > threshold for e in
+                                         [summary[name]['time_exponent_n'], summary[name]['memory_exponent_n']])
+    return {'runs': runs, 'summary': summary}
+
+
+def parse_arguments(parser):
+    parser.add_argument('--metrics', nargs='+', default=list(METRICS), choices=list(METRICS),
+                        help='Metrics to benchmark. (default: all)')
+    parser.add_argument('--n', nargs='+', type=int, default=[250, 500, 1000, 2000],
+                        help='Numbers of rows, with d = --d_fixed. (default: 250 500 1000 2000)')
+    parser.add_argument('--d', nargs='+', type=int, default=[5, 20, 80],
+                        help='Numbers of features, with n = --n_fixed. (default: 5 20 80)')
+    parser.add_argument('--n_fixed', type=int, default=500,
+                        help='Number of rows of the sweep in d. (default: 500)')
+    parser.add_argument('--d_fixed', type=int, default=10,
+                        help='Number of features of the sweep in n. (default: 10)')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of timed runs (the best is kept). (default: 3)')
+    parser.add_argument('--threshold', type=float, default=1.5,
+                        help='Growth exponent in n flagged as quadratic. (default: 1.5)')
+    parser.add_argument('--out', default='bench_metrics.json',
+                        help='Output JSON file. (default: bench_metrics.json)')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments(argparse.ArgumentParser())
+
+    checks = check_references()
+    for check, ok in checks.items():
+        print('{}: {}'.format(check, 'ok' if ok else 'MISMATCH'))
+
+    results = run(args.metrics, args.n, args.d, args.n_fixed, args.d_fixed,
+                  repeat=args.repeat, threshold=args.threshold)
+    results['checks'] = checks
+
+    print()
+    for name, s in results['summary'].items():
+        print('{:22s} time ~ n^{} d^{}, memory ~ n^{}{}'.format(
+            name, *['{:.2f}'.format(e) if e is not None else '?' for e in
+                    [s['time_exponent_n'], s['time_exponent_d'], s['memory_exponent_n']]],
+            '  <- quadratic' if s['quadratic'] else ''))
+
+    with open(args.out, 'w') as f:
+        json.dump(results, f, indent=2)
@@ -0,0 +1,212 @@
+# Opt-in instrumentation of the hot paths (loading, processing, descriptors, comparison, generation).
+# Stages are timed with the stage() context manager or the instrument() decorator.
+# When disabled (default), a stage costs a single flag check.
+#
+# Example:
+#   import instrumentation
+#   instrumentation.enable(memory=True)
+#   ds = AutoML('data/iris', 'iris')
+#   ds.process_data()
+#   print(instrumentation.flame())
+#   instrumentation.save('run.json')
+
+# Imports
+import json
+import time
+import functools
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+_enabled = False
+_memory = False
+
+# Measures of the finished stages: (path, duration, memory delta, memory peak), path being the tuple of nested stage names
+_records = []
+_lock = threading.Lock()
+
+# Stack of the running stages, by thread
+_local = threading.local()
+
+# Instrumented functions, by stage name
+REGISTRY = dict()
+
+
+def enable(memory=False):
+    """
+        Enable the instrumentation.
+
+        :param memory: If True, also trace memory allocations (tracemalloc: slower).
+    """
+    global _enabled, _memory
+    _enabled = True
+    _memory = memory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    """ Disable the instrumentation (the measures are kept). """
+    global _enabled, _memory
+    _enabled = False
+    if _memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _memory = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    """ Remove the measures. """
+    with _lock:
+        del _records[:]
+
+
+def _stack():
+    if not hasattr(_local, 'stack'):
+        # Names of the running stages, and highest traced memory of each running stage
+        _local.stack = []
+        _local.peaks = []
+    return _local.stack
+
+
+@contextmanager
+def _measure(name):
+    stack = _stack()
+    stack.append(name)
+    path = tuple(stack)
+    memory = _memory and tracemalloc.is_tracing()
+    if memory:
+        # The tracemalloc peak is reset for each stage, the enclosing stages keep their own maximum
+        start_memory, peak = tracemalloc.get_traced_memory()
+        if _local.peaks:
+            _local.peaks[-1] = max(_local.peaks[-1], peak)
+        tracemalloc.reset_peak()
+        _local.peaks.append(start_memory)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        delta, peak = 0, 0
+        if memory:
+            peak = _local.peaks.pop()
+            if tracemalloc.is_tracing():
+                current, stage_peak = tracemalloc.get_traced_memory()
+                peak = max(peak, stage_peak)
+                if _local.peaks:
+                    _local.peaks[-1] = max(_local.peaks[-1], peak)
+                tracemalloc.reset_peak()
+                delta, peak = current - start_memory, peak - start_memory
+            else:
+                peak = 0
+        stack.pop()
+        with _lock:
+            _records.append((path, duration, delta, peak))
+
+
+@contextmanager
+def _nothing():
+    yield
+
+
+def stage(name):
+    """
+        Context manager timing a stage. Nested stages are reported as children of the enclosing one.
+
+        :param name: Name of the stage
+    """
+    if not _enabled:
+        return _nothing()
+    return _measure(name)
+
+
+def instrument(name=None):
+    """
+        Decorator timing each call of a function as a stage, and registering it in REGISTRY.
+
+        :param name: Name of the stage. Default: qualified name of the function.
+    """
+    def decorator(f):
+        stage_name = name or f.__qualname__
+        REGISTRY[stage_name] = f
+
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return f(*args, **kwargs)
+            with _measure(stage_name):
+                return f(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def report():
+    """
+        Aggregate the measures by stage path.
+        Self time is the time not spent in instrumented children.
+
+        :return: Dictionary {'a;b': {'calls', 'total', 'self', 'mean', 'max', 'memory_delta', 'memory_peak'}}
+                 (times in seconds, memory in bytes, only if enabled with memory=True)
+        :rtype: dict
+    """
+    with _lock:
+        records = list(_records)
+    stages = dict()
+    for path, duration, delta, peak in records:
+        key = ';'.join(path)
+        s = stages.setdefault(key, {'calls': 0, 'total': 0., 'self': 0., 'max': 0.,
+                                    'memory_delta': 0, 'memory_peak': 0})
+        s['calls'] += 1
+        s['total'] += duration
+        s['self'] += duration
+        s['max'] = max(s['max'], duration)
+        s['memory_delta'] += delta
+        s['memory_peak'] = max(s['memory_peak'], peak)
+        if len(path) > 1:
+            parent = stages.setdefault(';'.join(path[:-1]), {'calls': 0, 'total': 0., 'self': 0., 'max': 0.,
+                                                             'memory_delta': 0, 'memory_peak': 0})
+            parent['self'] -= duration
+    for s in stages.values():
+        s['mean'] = s['total'] / s['calls'] if s['calls'] else 0.
+    return stages
+
+
+def save(filepath):
+    """ Export the report in JSON. """
+    with open(filepath, 'w') as f:
+        json.dump(report(), f, indent=2, sort_keys=True)
+
+
+def folded():
+    """
+        Report in the folded stacks format of flame graph tools ('a;b;c <self time in microseconds>' lines).
+
+        :rtype: str
+    """
+    return '\n'.join('{} {}'.format(key, int(round(max(s['self'], 0) * 1e6)))
+                     for key, s in sorted(report().items()))
+
+
+def flame(width=40):
+    """
+        Flame-style summary: tree of the stages with their total time, calls and share of the run.
+
+        :param width: Width of the bars
+        :rtype: str
+    """
+    stages = report()
+    roots = sum(s['total'] for key, s in stages.items() if ';' not in key) or 1.
+    lines = []
+    # Depth-first order: children after their parent
+    for key in sorted(stages, key=lambda k: k.split(';')):
+        s = stages[key]
+        depth = key.count(';')
+        bar = '#' * int(round(width * s['total'] / roots))
+        line = '{:<{w}} {}{} {:.3f}s x{}'.format(bar, '  ' * depth, key.split(';')[-1], s['total'], s['calls'], w=width)
+        if s['memory_peak']:
+            line += ' peak {:.1f}MB'.format(s['memory_peak'] / 2 ** 20)
+        lines.append(line)
+    return '\n'.join(lines)
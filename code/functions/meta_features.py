@@ -0,0 +1,251 @@
+# Computation of meta-features (descriptors) of a dataset.
+# All the descriptors are computed from a single float view of the data,
+# column block by column block, and memorized by dataset fingerprint.
+
+# Imports
+import hashlib
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.model_selection import cross_val_score
+from sklearn.neighbors import KNeighborsClassifier
+from sklearn.tree import DecisionTreeClassifier
+from sklearn.naive_bayes import GaussianNB
+
+# Descriptors already computed, indexed by fingerprint (least recently used first)
+_cache = OrderedDict()
+
+# Maximum number of datasets in the cache
+CACHE_SIZE = 128
+
+# Landmarkers: simple and fast classifiers whose performances describe the dataset
+LANDMARKERS = {'landmark_1nn': lambda: KNeighborsClassifier(n_neighbors=1),
+               'landmark_stump': lambda: DecisionTreeClassifier(max_depth=1),
+               'landmark_naive_bayes': GaussianNB}
+
+
+def fingerprint(*arrays, **params):
+    """
+        Compute a hash identifying arrays (i.e. a dataset) and parameters.
+
+        :param arrays: Arrays to hash. None values are ignored.
+        :param params: Additional parameters to include in the hash.
+        :return: Hexadecimal digest
+        :rtype: str
+    """
+    h = hashlib.sha1()
+    for a in arrays:
+        if a is None:
+            continue
+        a = np.asarray(a)
+        h.update(str((a.shape, a.dtype.str)).encode())
+        if a.dtype == object:
+            h.update(repr(a.tolist()).encode())
+        else:
+            h.update(np.ascontiguousarray(a).tobytes())
+    h.update(repr(sorted(params.items())).encode())
+    return h.hexdigest()
+
+
+def clear_cache():
+    """ Forget the descriptors memorized by compute_descriptors. """
+    _cache.clear()
+
+
+def to_array(df):
+    """
+        Convert a DataFrame into a float ndarray.
+        Non numerical columns are replaced by their category codes, missing values by NaN.
+
+        :param df: pandas DataFrame
+        :return: Tuple (X, numeric): float array and boolean mask of the originally numerical columns
+        :rtype: Tuple
+    """
+    X = np.empty(df.shape, dtype=np.float64)
+    numeric = np.zeros(df.shape[1], dtype=bool)
+    for i in range(df.shape[1]):
+        column = df.iloc[:, i]
+        if pd.api.types.is_numeric_dtype(column):
+            X[:, i] = column.values
+            numeric[i] = True
+        else:
+            codes, _ = pd.factorize(column)
+            X[:, i] = np.where(codes < 0, np.nan, codes)
+    return X, numeric
+
+
+def _describe_block(X, symbolic):
+    """
+        Compute per-column statistics of a block of columns.
+
+        :param X: Float array (n, k) with NaN for missing values
+        :param symbolic: Boolean mask (k,) of the symbolic columns
+        :return: Dictionary of arrays
+        :rtype: dict
+    """
+    mask = ~np.isnan(X)
+    count = mask.sum(axis=0)
+    n = np.maximum(count, 1)
+
+    mean = np.where(mask, X, 0).sum(axis=0) / n
+    centered = np.where(mask, X - mean, 0)
+    squared = centered ** 2
+    m2 = squared.sum(axis=0) / n
+    m3 = (squared * centered).sum(axis=0) / n
+    m4 = (squared ** 2).sum(axis=0) / n
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Adjusted Fisher-Pearson coefficients, as computed by pandas
+        skewness = np.sqrt(count * (count - 1)) / (count - 2) * m3 / m2 ** 1.5
+        kurtosis = (count + 1) * (count - 1) * m4 / ((count - 2) * (count - 3) * m2 ** 2) \
+            - 3 * (count - 1) ** 2 / ((count - 2) * (count - 3))
+        std = np.sqrt(m2 * count / (count - 1))
+        # Standardized block, missing values at the mean
+        standardized = centered / np.sqrt(m2)
+    constant = m2 == 0
+    skewness[constant] = 0
+    kurtosis[constant] = 0
+    standardized[:, constant] = 0
+
+    entropy = np.full(X.shape[1], np.nan)
+    for i in np.flatnonzero(symbolic):
+        _, frequencies = np.unique(X[mask[:, i], i], return_counts=True)
+        if len(frequencies) > 0:
+            p = frequencies / frequencies.sum()
+            entropy[i] = -(p * np.log2(p)).sum()
+
+    return {'missing': X.shape[0] - count,
+            'defective': ~mask.all(axis=1),
+            'mean': mean,
+            'std': std,
+            'skewness': skewness,
+            'kurtosis': kurtosis,
+            'entropy': entropy,
+            'standardized': standardized}
+
+
+def _summary(descriptors, name, values):
+    """ Add min, max and mean of the finite values in descriptors dictionary.
+        Infinite values (e.g. skewness of columns with less than 3 values) are ignored.
+    """
+    values = values[np.isfinite(values)]
+    if len(values) > 0:
+        descriptors[name + '_min'] = values.min()
+        descriptors[name + '_max'] = values.max()
+        descriptors[name + '_mean'] = values.mean()
+
+
+def _landmarkers(X, labels, max_rows=2000, random_state=0):
+    """
+        Cross-validated accuracy of the landmarkers.
+
+        :param X: Standardized data without missing values
+        :param labels: Class of each row
+        :param max_rows: Number of rows used, to bound the computation time.
+        :return: Dictionary of scores
+        :rtype: dict
+    """
+    if len(labels) > max_rows:
+        rows = np.random.RandomState(random_state).choice(len(labels), max_rows, replace=False)
+        X, labels = X[rows], labels[rows]
+
+    _, frequencies = np.unique(labels, return_counts=True)
+    cv = min(3, frequencies.min())
+    if len(frequencies) < 2 or cv < 2:
+        return dict()
+
+    return {name: cross_val_score(model(), X, labels, cv=cv).mean()
+            for name, model in LANDMARKERS.items()}
+
+
+def compute_descriptors(X, y=None, symbolic=None, numeric=None, classification=False,
+                        landmarkers=False, block_size=64, n_jobs=1, cache=True):
+    """
+        Compute the descriptors (meta-features) of a dataset in a single pass over column blocks.
+        - missing_proba: Probability of missing values
+        - defective_proba: Probability of defective records (rows with missing values)
+        - mean_*, std_*, skewness_*, kurtosis_*: Moments of the numerical columns (min, max, mean)
+        - entropy_*: Entropy (bits) of the symbolic columns (min, max, mean)
+        - correlation_mean, correlation_max: Absolute correlations between columns
+        - class_deviation: Standard deviation of class distribution
+        - class_entropy, class_imbalance: Entropy of the classes and ratio between the rarest and the most frequent one
+        - landmark_*: Accuracy of simple classifiers (1-NN, decision stump, naive Bayes)
+
+        :param X: Float array (n, d), with NaN for missing values (see to_array)
+        :param y: Float array (n, t) of labels, optional.
+        :param symbolic: Boolean mask of the symbolic (binary, categorical) columns. None for no symbolic column.
+        :param numeric: Boolean mask of the columns on which moments are computed. None for all the columns.
+        :param classification: If True, y contains classes (one column of labels or one-hot columns).
+        :param landmarkers: If True, compute the landmarkers (classification only, trains cross-validated models).
+        :param block_size: Number of columns processed by each job.
+        :param n_jobs: Number of jobs to run in parallel.
+        :param cache: If True, descriptors are memorized by dataset fingerprint
+                      (the CACHE_SIZE least recently used datasets, see clear_cache).
+        :return: Descriptors
+        :rtype: dict
+    """
+    X = np.asarray(X, dtype=np.float64)
+    n, d = X.shape
+    symbolic = np.zeros(d, dtype=bool) if symbolic is None else np.asarray(symbolic, dtype=bool)
+    numeric = np.ones(d, dtype=bool) if numeric is None else np.asarray(numeric, dtype=bool)
+    if y is not None:
+        y = np.asarray(y, dtype=np.float64).reshape(n, -1)
+
+    key = None
+    if cache:
+        key = fingerprint(X, y, symbolic, numeric, classification=classification,
+                          landmarkers=landmarkers)
+        if key in _cache:
+            _cache.move_to_end(key)
+            return dict(_cache[key])
+
+    # Per-column statistics, column blocks in parallel (numpy releases the GIL)
+    starts = range(0, d, block_size)
+    blocks = Parallel(n_jobs=n_jobs, prefer='threads')(
+        delayed(_describe_block)(X[:, s:s + block_size], symbolic[s:s + block_size]) for s in starts)
+    stats = {k: np.concatenate([b[k] for b in blocks], axis=-1 if k == 'standardized' else 0)
+             for k in blocks[0] if k != 'defective'}
+    defective = np.logical_or.reduce([b['defective'] for b in blocks])
+
+    descriptors = dict()
+    descriptors['missing_proba'] = (stats['missing'] / n).mean()
+    descriptors['defective_proba'] = defective.mean()
+
+    # Moments
+    for name in ['mean', 'std', 'skewness', 'kurtosis']:
+        _summary(descriptors, name, stats[name][numeric])
+
+    # Entropy of symbolic variables
+    _summary(descriptors, 'entropy', stats['entropy'][symbolic])
+
+    # Correlations between numerical variables
+    Z = stats['standardized']
+    if numeric.sum() > 1:
+        Zn = Z[:, numeric]
+        corr = np.abs(Zn.T @ Zn) / n
+        off_diagonal = corr[~np.eye(len(corr), dtype=bool)]
+        descriptors['correlation_mean'] = off_diagonal.mean()
+        descriptors['correlation_max'] = off_diagonal.max()
+
+    # Classes
+    if y is not None:
+        descriptors['class_deviation'] = np.nanstd(y, axis=0, ddof=1).mean()
+
+        if classification:
+            labels = y.argmax(axis=1) if y.shape[1] > 1 else y[:, 0]
+            known = ~np.isnan(labels)
+            _, frequencies = np.unique(labels[known], return_counts=True)
+            p = frequencies / frequencies.sum()
+            descriptors['class_entropy'] = -(p * np.log2(p)).sum()
+            descriptors['class_imbalance'] = p.min() / p.max()
+
+            if landmarkers:
+                descriptors.update(_landmarkers(Z[known], labels[known]))
+
+    if cache:
+        _cache[key] = dict(descriptors)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+    return descriptors
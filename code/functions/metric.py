@@ -1,6 +1,5 @@
 import numpy as np
 import scipy as sp
-import matplotlib.pyplot as plt
 from sklearn.preprocessing import StandardScaler
 from scipy.spatial.distance import pdist, cdist, squareform
 from scipy.stats import ks_2samp 
@@ -93,10 +92,10 @@ def acc_stat (solution, prediction):
     ''' Return accuracy statistics TN, FP, TP, FN
      Assumes that solution and prediction are binary 0/1 vectors.'''
      # This uses floats so the results are floats
-    TN = sum(np.multiply((1-solution), (1-prediction)))
-    FN = sum(np.multiply(solution, (1-prediction)))
-    TP = sum(np.multiply(solution, prediction))
-    FP = sum(np.multiply((1-solution), prediction))
+    TN = np.sum(np.multiply((1-solution), (1-prediction)))
+    FN = np.sum(np.multiply(solution, (1-prediction)))
+    TP = np.sum(np.multiply(solution, prediction))
+    FP = np.sum(np.multiply((1-solution), prediction))
     #print "TN =",TN
     #print "FP =",FP
     #print "TP =",TP
@@ -108,11 +107,11 @@ def bac_metric (solution, prediction):
     [tn,fp,tp,fn] = acc_stat(solution, prediction)
     # Bounding to avoid division by 0
     eps = 1e-15
-    tp = sp.maximum (eps, tp)
-    pos_num = sp.maximum (eps, tp+fn)
+    tp = np.maximum (eps, tp)
+    pos_num = np.maximum (eps, tp+fn)
     tpr = tp / pos_num # true positive rate (sensitivity)
-    tn = sp.maximum (eps, tn)
-    neg_num = sp.maximum (eps, tn+fp)
+    tn = np.maximum (eps, tn)
+    neg_num = np.maximum (eps, tn+fp)
     tnr = tn / neg_num # true negative rate (specificity)
     bac = 0.5*(tpr + tnr)
     return bac
@@ -0,0 +1,296 @@
+# Headless reports of the show_* methods of AutoML and Comparator.
+# Each show_* call is a task run in a worker process with the Agg backend:
+# plt.show() saves the open figures to PNG files, printed text and displayed tables are captured.
+# The results are written as one HTML page and its PNG files per dataset (bundle directory).
+#
+# Example:
+#   import report
+#   ds = AutoML('data/iris', 'iris')
+#   ds.report('reports/iris')                            # AutoML.report calls report.automl_report
+#   report.write_reports([('reports/iris', 'iris', ds, report.automl_tasks(ds)),
+#                         ('reports/wine', 'wine', ds2, report.automl_tasks(ds2))], njobs=8)
+
+# Imports
+import os
+import re
+import io
+import sys
+import argparse
+import html
+import base64
+import pickle
+import traceback
+import multiprocessing
+from contextlib import redirect_stdout
+from concurrent.futures import ProcessPoolExecutor
+
+# Default maximum number of rows of the pairplots, heatmaps and T-SNE (sampled above)
+MAX_ROWS = 2000
+
+# Objects loaded by a worker process, by pickle file path (only the last one is kept)
+_objects = dict()
+
+# Output blocks of the running task: ('text', str), ('html', str) or ('image', filename)
+_blocks = []
+_figure_path = None
+
+
+def automl_tasks(ds, sets=['X_train', 'X_test', 'y_train', 'y_test'], processed=False, max_features=20,
+                 max_rows=MAX_ROWS, n_components_pca=50):
+    """
+        Tasks of an AutoML report (same content as AutoML.show_characteristics).
+
+        :param ds: AutoML object
+        :param sets: Sets to describe
+        :param processed: Boolean defining whether to describe the raw data or the processed data
+        :param max_features: Maximum number of features of the pairplots
+        :param max_rows: Maximum number of rows of the pairplots, heatmaps and T-SNE (None: all rows)
+        :param n_components_pca: Number of PCA components computed before T-SNE
+        :return: List of tasks (section title, method name, args, kwargs)
+        :rtype: list
+    """
+    x_sets, y_sets = ds.choose_sets(sets)
+    tasks = [('Descriptors', 'show_descriptors', (processed,), {})]
+    for x in x_sets:
+        tasks.append(('Scatter plot matrix ({})'.format(x), 'show_pairplot', (x, processed),
+                      {'max_features': max_features, 'max_rows': max_rows}))
+    for x in x_sets:
+        tasks.append(('Correlation matrix ({})'.format(x), 'show_correlation', (x, processed), {}))
+    for x in x_sets:
+        tasks.append(('Hierarchical clustering heatmap ({})'.format(x), 'show_hierarchical_clustering', (x, processed),
+                      {'max_rows': max_rows}))
+    for y in y_sets:
+        tasks.append(('Classes distribution ({})'.format(y), 'show_classes', (y, processed), {}))
+    if len(y_sets) > 0:
+        for name, method, kwargs in [('Principal components analysis', 'show_pca', {}),
+                                     ('t-distributed stochastic neighbor embedding', 'show_tsne',
+                                      {'max_samples': max_rows, 'n_components_pca': n_components_pca}),
+                                     ('Linear discriminant analysis', 'show_lda', {})]:
+            for x, y in zip(x_sets, y_sets):
+                tasks.append(('{} ({}, {})'.format(name, x, y), method, (x, y, processed), kwargs))
+    return tasks
+
+
+def comparator_tasks(comparator):
+    """
+        Tasks of a Comparator report.
+
+        :param comparator: Comparator object
+        :return: List of tasks (section title, method name, args, kwargs)
+        :rtype: list
+    """
+    return [('Descriptors distances', 'show_descriptors', (), {}),
+            ('Comparison matrix', 'show_comparison_matrix', (), {}),
+            ('Discriminator score', 'show_classifier_score', (), {}),
+            ('Accumulation of minimum distances', 'show_mda', (), {})]
+
+
+class _Capture(io.TextIOBase):
+    """ Standard output of a task, appended to the text blocks. """
+    def write(self, s):
+        if _blocks and _blocks[-1][0] == 'text':
+            _blocks[-1] = ('text', _blocks[-1][1] + s)
+        else:
+            _blocks.append(('text', s))
+        return len(s)
+
+
+def _display(*objs, **kwargs):
+    for obj in objs:
+        if hasattr(obj, 'to_html'):
+            _blocks.append(('html', obj.to_html()))
+        else:
+            _Capture().write(repr(obj) + '\n')
+
+
+def _printmd(string):
+    # Markdown bold (the only markup used by the show_* methods)
+    text = re.sub(r'\*\*\s*(.*?)\s*\*\*', r'<b>\1</b>', html.escape(string))
+    _blocks.append(('html', '<p>{}</p>'.format(text)))
+
+
+def _show(*args, **kwargs):
+    """ Replacement of plt.show: save the open figures. """
+    import matplotlib.pyplot as plt
+    for number in plt.get_fignums():
+        filename = '{}_{}.png'.format(_figure_path, sum(1 for b in _blocks if b[0] == 'image'))
+        plt.figure(number).savefig(filename, bbox_inches='tight')
+        _blocks.append(('image', os.path.basename(filename)))
+    plt.close('all')
+
+
+def _init_worker(cache_dir=None):
+    """ Worker process: Agg backend, capture of the outputs of the show_* methods and T-SNE cache directory. """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    plt.show = _show
+    import utilities
+    import auto_ml
+    import comparator
+    for module in [utilities, auto_ml, comparator]:
+        module.display = _display
+        module.printmd = _printmd
+    utilities.TSNE_CACHE_DIR = cache_dir
+
+
+def _load(path):
+    if path not in _objects:
+        _objects.clear()
+        with open(path, 'rb') as f:
+            _objects[path] = pickle.load(f)
+    return _objects[path]
+
+
+def _run(path, method, args, kwargs, figure_path):
+    """ Run a show_* method in a worker process. Errors are reported in the output blocks. """
+    global _figure_path
+    _figure_path = figure_path
+    del _blocks[:]
+    try:
+        with redirect_stdout(_Capture()):
+            getattr(_load(path), method)(*args, **kwargs)
+    except Exception:
+        _blocks.append(('error', traceback.format_exc(limit=5)))
+    # Figures not shown by the method
+    _show()
+    return list(_blocks)
+
+
+def _html(title, sections, out_dir, embed=False):
+    parts = ['<!DOCTYPE html>', '<html><head><meta charset="utf-8"><title>{}</title>'.format(html.escape(title)),
+             '<style>body{font-family:sans-serif;margin:2em} pre{background:#f6f6f6;padding:.5em} '
+             '.error{color:#b00} img{max-width:100%} table{border-collapse:collapse} '
+             'td,th{border:1px solid #ccc;padding:2px 6px}</style></head><body>',
+             '<h1>{}</h1>'.format(html.escape(title))]
+    for section, blocks in sections:
+        parts.append('<h2>{}</h2>'.format(html.escape(section)))
+        for kind, content in blocks:
+            if kind == 'text':
+                if content.strip():
+                    parts.append('<pre>{}</pre>'.format(html.escape(content.strip('\n'))))
+            elif kind == 'html':
+                parts.append(content)
+            elif kind == 'error':
+                parts.append('<pre class="error">{}</pre>'.format(html.escape(content)))
+            elif embed:
+                with open(os.path.join(out_dir, content), 'rb') as f:
+                    data = base64.b64encode(f.read()).decode()
+                os.remove(os.path.join(out_dir, content))
+                parts.append('<img src="data:image/png;base64,{}">'.format(data))
+            else:
+                parts.append('<img src="{}">'.format(html.escape(content)))
+    parts.append('</body></html>')
+    return '\n'.join(parts)
+
+
+def write_reports(reports, njobs=None, embed=False, cache_dir=None):
+    """
+        Render reports in parallel worker processes (Agg backend).
+        All the tasks of all the reports share the same pool, so that many reports can be generated unattended.
+
+        :param reports: List of (output directory, title, object, tasks), tasks being a list of
+                        (section title, method name, args, kwargs) of the object (see automl_tasks and comparator_tasks)
+        :param njobs: Number of worker processes. Default: number of CPUs.
+        :param embed: If True, the images are embedded in the HTML file (single file per report)
+        :param cache_dir: Directory of the T-SNE embeddings, reused by the next reports of the same data (None: no reuse)
+        :return: Paths of the HTML files
+        :rtype: list
+    """
+    paths = []
+    for out_dir, title, obj, tasks in reports:
+        if not os.path.isdir(out_dir):
+            os.makedirs(out_dir)
+        # The object is sent once to each worker, through a file
+        paths.append(os.path.join(out_dir, 'data.pkl'))
+        with open(paths[-1], 'wb') as f:
+            pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    # Fresh processes: the Agg backend is selected before matplotlib is imported
+    context = multiprocessing.get_context('spawn')
+    files = []
+    try:
+        with ProcessPoolExecutor(max_workers=njobs, mp_context=context, initializer=_init_worker,
+                                 initargs=(cache_dir,)) as executor:
+            futures = [[executor.submit(_run, path, method, args, kwargs, os.path.join(out_dir, 'figure_{:02d}'.format(i)))
+                        for i, (section, method, args, kwargs) in enumerate(tasks)]
+                       for path, (out_dir, title, obj, tasks) in zip(paths, reports)]
+            for futures_report, (out_dir, title, obj, tasks) in zip(futures, reports):
+                sections = [(task[0], future.result()) for task, future in zip(tasks, futures_report)]
+                files.append(os.path.join(out_dir, 'index.html'))
+                with open(files[-1], 'w') as f:
+                    f.write(_html(title, sections, out_dir, embed=embed))
+                print('Report: {}'.format(files[-1]))
+    finally:
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+    return files
+
+
+def automl_report(ds, out_dir, njobs=None, embed=False, cache_dir=None, **kwargs):
+    """
+        Write the report of an AutoML dataset.
+
+        :param ds: AutoML object
+        :param out_dir: Output directory (index.html and PNG files)
+        :param njobs: Number of worker processes
+        :param embed: If True, the images are embedded in the HTML file
+        :param cache_dir: Directory of the T-SNE embeddings (None: no reuse)
+        :param kwargs: Parameters of automl_tasks (sets, processed, max_features, max_rows, n_components_pca)
+        :return: Path of the HTML file
+        :rtype: str
+    """
+    return write_reports([(out_dir, ds.basename, ds, automl_tasks(ds, **kwargs))], njobs=njobs, embed=embed,
+                         cache_dir=cache_dir)[0]
+
+
+def comparator_report(comparator, out_dir, njobs=None, embed=False):
+    """
+        Write the report of a comparison.
+
+        :param comparator: Comparator object
+        :param out_dir: Output directory (index.html and PNG files)
+        :param njobs: Number of worker processes
+        :param embed: If True, the images are embedded in the HTML file
+        :return: Path of the HTML file
+        :rtype: str
+    """
+    title = '{} / {}'.format(comparator.ds1.basename, comparator.ds2.basename)
+    return write_reports([(out_dir, title, comparator, comparator_tasks(comparator))], njobs=njobs, embed=embed)[0]
+
+
+def parse_arguments(parser):
+    parser.add_argument('--data', nargs=2, action='append', metavar=('INPUT_DIR', 'BASENAME'), required=True,
+                        help='AutoML dataset (repeat the option for several datasets).')
+    parser.add_argument('--out', default='reports',
+                        help='Output directory, one subdirectory per dataset. (default: reports)')
+    parser.add_argument('--njobs', type=int, default=None,
+                        help='Number of worker processes. (default: number of CPUs)')
+    parser.add_argument('--processed', action='store_true',
+                        help='Describe the processed data.')
+    parser.add_argument('--max_rows', type=int, default=MAX_ROWS,
+                        help='Maximum number of rows of the pairplots, heatmaps and T-SNE. (default: {})'.format(MAX_ROWS))
+    parser.add_argument('--embed', action='store_true',
+                        help='Embed the images in the HTML files.')
+    parser.add_argument('--cache_dir', default=None,
+                        help='Directory of the T-SNE embeddings, reused by the next runs. (default: none)')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments(argparse.ArgumentParser())
+    root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    for problem_dir in ['auto_ml', 'processing', 'functions', 'models']:
+        if os.path.join(root, problem_dir) not in sys.path:
+            sys.path.append(os.path.join(root, problem_dir))
+    from auto_ml import AutoML
+
+    reports = []
+    for input_dir, basename in args.data:
+        ds = AutoML(input_dir, basename)
+        if args.processed:
+            ds.process_data()
+        reports.append((os.path.join(args.out, basename), basename, ds,
+                        automl_tasks(ds, processed=args.processed, max_rows=args.max_rows)))
+    write_reports(reports, njobs=args.njobs, embed=args.embed, cache_dir=args.cache_dir)
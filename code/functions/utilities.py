@@ -1,16 +1,49 @@
 # Useful functions for computation and visualization of data descriptors
 
 # Imports
-import matplotlib.pyplot as plt
-import seaborn as sns
+import importlib
 import numpy as np
 import pandas as pd
-from IPython.display import display, Markdown
 from metric import *
 from copy import deepcopy # for preprocessing
+import pickle
+import meta_features
+
+
+class _LazyModule():
+    def __init__(self, name):
+        """
+            Module imported on its first use.
+            Plotting, IPython and torch take seconds to import: the compute paths
+            (loading, processing, metrics) should not pay for them.
+
+            :param name: Name of the module (e.g. 'matplotlib.pyplot')
+        """
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        return '<lazy module {!r}{}>'.format(self._name, '' if self._module is None else ' (loaded)')
+
+
+# Plotting
+plt = _LazyModule('matplotlib.pyplot')
+sns = _LazyModule('seaborn')
+mpl = _LazyModule('matplotlib')
+_ipython_display = _LazyModule('IPython.display')
 
 # Hierarchical clustering
-import matplotlib as mpl
 import scipy
 import scipy.cluster.hierarchy as sch
 import scipy.spatial.distance as dist
@@ -19,11 +52,11 @@ import time
 import sys, os
 import getopt
 
-# PCA, LDA, T-SNE
+# PCA, LDA (T-SNE is imported in compute_tsne)
 from sklearn.decomposition import PCA
+from sklearn.model_selection import train_test_split
 from itertools import combinations
 from sklearn.discriminant_analysis import LinearDiscriminantAnalysis
-from sklearn.manifold import TSNE
 
 # Kolmogorov-Smirnov, Chi-square
 from scipy.stats import ks_2samp
@@ -39,15 +72,31 @@ from scipy.integrate import simps
 from numpy import trapz
 
 # MMD
-import torch as th
-from torch.autograd import Variable
+th = _LazyModule('torch')
+
+# T-SNE embeddings, by fingerprint of the data and parameters (see compute_tsne)
+_tsne_cache = dict()
+# Directory of the saved T-SNE embeddings (None: in memory only)
+TSNE_CACHE_DIR = None
+
+
+def display(*objs, **kwargs):
+    """ IPython display, or print in command line use (without IPython). """
+    try:
+        _ipython_display.display(*objs, **kwargs)
+    except ImportError:
+        print(*objs)
+
 
 def printmd(string):
     """ Print Markdown string
     
         :param string: String to display.
     """
-    display(Markdown(string))
+    try:
+        _ipython_display.display(_ipython_display.Markdown(string))
+    except ImportError:
+        print(string)
 
 def normalize(l, normalization='probability'):
     """ Return a normalized list
@@ -56,10 +105,12 @@ def normalize(l, normalization='probability'):
                          'min-max': min become 0 and max become 1
     """
     if normalization=='probability':
-        return [float(i)/sum(l) for i in l]
+        total = sum(l)
+        return [float(i)/total for i in l]
     
     elif normalization=='min-max':
-        return [(float(i) - min(l)) / (max(l) - min(l)) for i in l]
+        mini, maxi = min(l), max(l)
+        return [(float(i) - mini) / (maxi - mini) for i in l]
     
     else: # mean std ?
         raise ValueError('Argument normalization is invalid.')
@@ -88,7 +139,7 @@ def show_correlation(df, size=10):
     plt.show()
 
 def heatmap(X, row_method, column_method, row_metric, column_metric,
-            color_gradient):
+            color_gradient, max_rows=None, reduce='sample', seed=0):
 
     print(
         "\nPerforming hierarchical clustering using {} for columns and {} for rows".
@@ -99,6 +150,10 @@ def heatmap(X, row_method, column_method, row_metric, column_metric,
     http://stackoverflow.com/questions/7664826/how-to-get-flat-clustering-corresponding-to-color-clusters-in-the-dendrogram-cre
 
     x is an m by n ndarray, m observations, n genes
+
+    With more than max_rows rows, the rows are reduced before the clustering (O(m^2) memory):
+      reduce='sample': random sample of max_rows rows
+      reduce='kmeans': max_rows k-means centroids (label: centroid number and size)
     """
 
     ### Define variables
@@ -106,6 +161,24 @@ def heatmap(X, row_method, column_method, row_metric, column_metric,
     column_header = column_header = ['T' + str(dataset) for dataset in list(X)]  # X.columns.values
     row_header = ['A' + str(model) for model in list(X.index)]  # X.index
 
+    ### Reduce the rows
+    if max_rows is not None and len(x) > max_rows:
+        start_time = time.time()
+        if reduce == 'sample':
+            rows = np.sort(np.random.RandomState(seed).choice(len(x), max_rows, replace=False))
+            x = x[rows]
+            row_header = [row_header[i] for i in rows]
+        elif reduce == 'kmeans':
+            from sklearn.cluster import MiniBatchKMeans
+            kmeans = MiniBatchKMeans(n_clusters=max_rows, random_state=seed, n_init=3).fit(x)
+            sizes = np.bincount(kmeans.labels_, minlength=max_rows)
+            x = kmeans.cluster_centers_
+            row_header = ['C{} (n={})'.format(i, size) for i, size in enumerate(sizes)]
+        else:
+            raise ValueError('Argument reduce is invalid.')
+        print('Rows reduced from {} to {} ({}) in {} seconds'.format(
+            len(X), len(x), reduce, round(time.time() - start_time, 1)))
+
     ### Define the color gradient to use based on the provided name
     n = len(x[0])
     m = len(x)
@@ -189,12 +262,12 @@ def heatmap(X, row_method, column_method, row_metric, column_metric,
     # Compute and plot bottom dendrogram
     if column_method != None:
         start_time = time.time()
-        d2 = dist.pdist(x.T)
-        D2 = dist.squareform(d2)
+        # Condensed distances: linkage does not recompute them
+        d2 = dist.pdist(x.T, metric=column_metric)
         ax2 = fig.add_axes([ax2_x, ax2_y, ax2_w, ax2_h], frame_on=True)
-        Y2 = sch.linkage(D2, method=column_method, metric=column_metric)  
+        Y2 = sch.linkage(d2, method=column_method)  
         ### array-clustering metric - 'average', 'single', 'centroid', 'complete'
-        Z2 = sch.dendrogram(Y2, orientation='bottom')
+        Z2 = sch.dendrogram(Y2, orientation='bottom', no_labels=True)
         ind2 = sch.fcluster(Y2, 0.7 * max(Y2[:, 2]), 'distance')  
         ### This is the default behavior of dendrogram
         ax2.set_xticks([])  ### Hides ticks
@@ -208,13 +281,12 @@ def heatmap(X, row_method, column_method, row_metric, column_metric,
     # Compute and plot right dendrogram.
     if row_method != None:
         start_time = time.time()
-        d1 = dist.pdist(x)
-        D1 = dist.squareform(d1)  # full matrix
+        d1 = dist.pdist(x, metric=row_metric)
         ax1 = fig.add_axes([ax1_x, ax1_y, ax1_w, ax1_h], frame_on=True)  
         # frame_on may be False
-        Y1 = sch.linkage(D1, method=row_method, metric=row_metric)  
+        Y1 = sch.linkage(d1, method=row_method)  
         ### gene-clustering metric - 'average', 'single', 'centroid', 'complete'
-        Z1 = sch.dendrogram(Y1, orientation='right')
+        Z1 = sch.dendrogram(Y1, orientation='right', no_labels=True)
         ind1 = sch.fcluster(Y1, 0.7 * max(Y1[:, 2]), 'distance')  
         ### This is the default behavior of dendrogram
         # print 'ind1', ind1
@@ -230,79 +302,27 @@ def heatmap(X, row_method, column_method, row_metric, column_metric,
     axm = fig.add_axes([axm_x, axm_y, axm_w, axm_h])  
     # axes for the data matrix
     xt = x
-    if column_method != None:
-        idx2 = Z2['leaves']  
-        ### apply the clustering for the array-dendrograms to the actual matrix data
-        xt = xt[:, idx2]
-        # print 'idx2', idx2, len(idx2)
-        # print 'ind2', ind2, len(ind2)
-        ind2 = [ind2[i] for i in idx2]
-        # ind2 = ind2[:,idx2] ### reorder the flat cluster to match the order of the leaves the dendrogram
-    if row_method != None:
-        idx1 = Z1['leaves']  
-        ### apply the clustering for the gene-dendrograms to the actual matrix data
-        xt = xt[idx1, :]  # xt is transformed x
-        # ind1 = ind1[idx1,:] ### reorder the flat cluster to match the order of the leaves the dendrogram
-        ind1 = [ind1[i] for i in idx1]
+    # Leaves order (identity when not clustering)
+    idx2 = np.array(Z2['leaves']) if column_method != None else np.arange(x.shape[1])
+    idx1 = np.array(Z1['leaves']) if row_method != None else np.arange(x.shape[0])
+    ### apply the clustering to the actual matrix data, and reorder the flat clusters to match the order of the leaves
+    xt = x[np.ix_(idx1, idx2)]  # xt is transformed x
+    ind2 = np.asarray(ind2)[idx2]
+    ind1 = np.asarray(ind1)[idx1]
     ### taken from http://stackoverflow.com/questions/2982929/plotting-results-of-hierarchical-clustering-ontop-of-a-matrix-of-data-in-python/3011894#3011894
-    # print xt
     im = axm.matshow(xt, aspect='auto', origin='lower', cmap=cmap, norm=norm)  
     ### norm=norm added to scale coloring of expression with zero = white or black
     axm.set_xticks([])  ### Hides x-ticks
     axm.set_yticks([])
 
     # Add text
-    new_row_header = []
-    new_column_header = []
-    for i in range(x.shape[0]):
-        if row_method != None:
-            if len(
-                    row_header
-            ) < 100:  ### Don't visualize gene associations when more than 100 rows
-                axm.text(x.shape[1] - 0.5, i, '  ' + row_header[idx1[i]])
-            new_row_header.append(row_header[idx1[i]])
-        else:
-            if len(
-                    row_header
-            ) < 100:  ### Don't visualize gene associations when more than 100 rows
-                axm.text(x.shape[1] - 0.5, i,
-                         '  ' + row_header[i])  ### When not clustering rows
-            new_row_header.append(row_header[i])
-    for i in range(x.shape[1]):
-        if column_method != None:
-            axm.text(
-                i,
-                -0.9,
-                ' ' + column_header[idx2[i]],
-                rotation=270,
-                verticalalignment="top")  # rotation could also be degrees
-            new_column_header.append(column_header[idx2[i]])
-        else:  ### When not clustering columns
-            axm.text(
-                i,
-                -0.9,
-                ' ' + column_header[i],
-                rotation=270,
-                verticalalignment="top")
-            new_column_header.append(column_header[i])
-
-    for j in range(x.shape[0]):
-        if row_method != None:
-            axm.text(
-                len(new_column_header) + 1,
-                j,
-                ' ' + row_header[idx1[j]],
-                rotation=0,
-                verticalalignment="top")  # rotation could also be degrees
-            new_row_header.append(row_header[idx1[j]])
-        else:  ### When not clustering columns
-            axm.text(
-                len(new_column_header) + 1,
-                j,
-                ' ' + row_header[j],
-                rotation=0,
-                verticalalignment="top")
-            new_row_header.append(row_header[j])
+    new_row_header = [row_header[i] for i in idx1]
+    new_column_header = [column_header[i] for i in idx2]
+    if len(row_header) < 100:  ### Don't visualize gene associations when more than 100 rows
+        for i, header in enumerate(new_row_header):
+            axm.text(x.shape[1] - 0.5, i, '  ' + header)
+    for i, header in enumerate(new_column_header):
+        axm.text(i, -0.9, ' ' + header, rotation=270, verticalalignment="top")  # rotation could also be degrees
 
     # Plot colside colors
     # axc --> axes for column side colorbar
@@ -310,8 +330,7 @@ def heatmap(X, row_method, column_method, row_metric, column_metric,
         axc = fig.add_axes([axc_x, axc_y, axc_w,
                             axc_h])  # axes for column side colorbar
         cmap_c = mpl.colors.ListedColormap(['r', 'g', 'b', 'y', 'w', 'k', 'm'])
-        dc = np.array(ind2, dtype=int)
-        dc.shape = (1, len(ind2))
+        dc = ind2.astype(int)[np.newaxis, :]
         im_c = axc.matshow(dc, aspect='auto', origin='lower', cmap=cmap_c)
         axc.set_xticks([])  ### Hides ticks
         axc.set_yticks([])
@@ -321,9 +340,7 @@ def heatmap(X, row_method, column_method, row_metric, column_metric,
     if row_method != None:
         axr = fig.add_axes([axr_x, axr_y, axr_w,
                             axr_h])  # axes for column side colorbar
-        dr = np.array(ind1, dtype=int)
-        dr.shape = (len(ind1), 1)
-        #print ind1, len(ind1)
+        dr = ind1.astype(int)[:, np.newaxis]
         cmap_r = mpl.colors.ListedColormap(['r', 'g', 'b', 'y', 'w', 'k', 'm'])
         im_r = axr.matshow(dr, aspect='auto', origin='lower', cmap=cmap_r)
         axr.set_xticks([])  ### Hides ticks
@@ -453,18 +470,77 @@ def show_lda(X, y, verbose=False, **kwargs):
     plt.show()
 
 
-def compute_tsne(X, verbose=False, **kwargs):
+def compute_tsne(X, y=None, verbose=False, max_samples=None, n_components_pca=None, seed=0, cache=True, **kwargs):
     """ 
         Compute T-SNE.
+        Large data is approximated: stratified subsample of max_samples rows, PCA pre-reduction
+        to n_components_pca dimensions, Barnes-Hut gradient (sklearn default, see 'angle' parameter).
+        Embeddings are memorized by fingerprint of the data and parameters (and saved in TSNE_CACHE_DIR if set).
 
         :param X: Data 
+        :param y: Labels, used to stratify the subsample
         :param verbose: Display additional information during run
+        :param max_samples: Maximum number of embedded rows (None: all rows)
+        :param n_components_pca: Number of PCA components computed before T-SNE (None: no PCA)
+        :param seed: Random state of the subsample, the PCA and the T-SNE
+        :param cache: If False, recompute the embedding
         :param **kwargs: Additional parameters for T-SNE (see sklearn doc)
-        :return: Tuple (tsne, X) containing a T-SNE object (see sklearn doc) and the transformed data
+        :return: Tuple (tsne, X) containing a T-SNE object (see sklearn doc) and the transformed data.
+                 tsne.sample_index_ is the index of the embedded rows (None: all rows)
         :rtype: Tuple
     """
+    from sklearn.manifold import TSNE
+    X = np.asarray(X, dtype=np.float64)
+    labels = None
+    if y is not None:
+        labels = np.asarray(y)
+        if labels.ndim > 1:
+            labels = labels.argmax(axis=1) if labels.shape[1] > 1 else labels.ravel()
+
+    kwargs.setdefault('method', 'barnes_hut')
+    kwargs.setdefault('random_state', seed)
+    key = meta_features.fingerprint(X, labels, max_samples=max_samples, n_components_pca=n_components_pca,
+                                    seed=seed, **kwargs)
+    filepath = os.path.join(TSNE_CACHE_DIR, 'tsne_{}.pkl'.format(key)) if TSNE_CACHE_DIR is not None else None
+    if cache and key not in _tsne_cache and filepath is not None and os.path.exists(filepath):
+        with open(filepath, 'rb') as f:
+            _tsne_cache[key] = pickle.load(f)
+    if cache and key in _tsne_cache:
+        if verbose:
+            print('T-SNE embedding loaded from cache')
+        tsne = _tsne_cache[key]
+        return tsne, tsne.embedding_
+
+    # Stratified subsample
+    index = None
+    if max_samples is not None and len(X) > max_samples:
+        try:
+            index = train_test_split(np.arange(len(X)), train_size=max_samples, random_state=seed, stratify=labels)[0]
+        except ValueError:
+            # Classes with a single row: random subsample
+            index = np.random.RandomState(seed).choice(len(X), max_samples, replace=False)
+        index = np.sort(index)
+        X = X[index]
+
+    # PCA pre-reduction
+    if n_components_pca is not None and X.shape[1] > n_components_pca:
+        X = PCA(n_components=n_components_pca, random_state=seed).fit_transform(X)
+
+    start_time = time.time()
     tsne = TSNE(**kwargs)
     X = tsne.fit_transform(X)
+    tsne.sample_index_ = index
+    if verbose:
+        print('T-SNE of {} rows, {} features computed in {} seconds'.format(
+            X.shape[0], tsne.n_features_in_, round(time.time() - start_time, 1)))
+
+    if cache:
+        _tsne_cache[key] = tsne
+        if filepath is not None:
+            if not os.path.isdir(TSNE_CACHE_DIR):
+                os.makedirs(TSNE_CACHE_DIR)
+            with open(filepath, 'wb') as f:
+                pickle.dump(tsne, f)
 
     return tsne, X 
 
@@ -478,9 +554,9 @@ def show_tsne(X, y, i=1, j=2, verbose=False, **kwargs):
         :param i: i_th component of the T-SNE
         :param j: j_th component of the T-SNE
         :param verbose: Display additional information during run
-        :param **kwargs: Additional parameters for T-SNE (see sklearn doc)
+        :param **kwargs: Additional parameters for compute_tsne (max_samples, n_components_pca, ...) and T-SNE (see sklearn doc)
     """
-    tsne, X = compute_tsne(X, verbose=verbose, **kwargs)
+    tsne, X = compute_tsne(X, y, verbose=verbose, **kwargs)
     assert(i <= tsne.embedding_.shape[1] and j <= tsne.embedding_.shape[1] and i != j)
 
     if isinstance(y, pd.Series) or isinstance (y, pd.DataFrame):
@@ -489,6 +565,10 @@ def show_tsne(X, y, i=1, j=2, verbose=False, **kwargs):
     else:
         target_names = np.unique(y)
 
+    # Labels of the embedded rows
+    if tsne.sample_index_ is not None:
+        y = y[tsne.sample_index_]
+
     if y.shape[1] > 1:
         y = np.where(y==1)[1]
 
@@ -499,31 +579,58 @@ def show_tsne(X, y, i=1, j=2, verbose=False, **kwargs):
     plt.show()
   
     
-def minimum_distance(A, B, norm='manhattan'):
+def pairwise_distance(A, B, norm='manhattan'):
+    """ Compute the distances between each element of A and each element of B (same norms as metric.distance)
+
+        :param A: Distribution A (n, d)
+        :param B: Distribution B (m, d)
+        :param norm: 'l0', 'manhattan', 'euclidean', 'minimum', 'maximum'
+
+        :return: Distance matrix (n, m)
+        :rtype: ndarray
+    """
+    metrics = {'manhattan': 'cityblock', 'euclidean': 'euclidean', 'maximum': 'chebyshev'}
+    if norm in metrics:
+        return dist.cdist(A, B, metric=metrics[norm])
+    elif norm in ['minimum', 'l0']:
+        # Feature by feature, to bound memory to (n, m)
+        D = np.full((len(A), len(B)), np.inf if norm == 'minimum' else 0.)
+        for k in range(A.shape[1]):
+            z = A[:, k, None] - B[None, :, k]
+            if norm == 'minimum':
+                np.minimum(D, np.abs(z), out=D)
+            else:
+                D += z != 0
+        return D
+    else:
+        raise ValueError('Argument norm is invalid.')
+
+def minimum_distance(A, B, norm='manhattan', block_size=None):
     """ Compute for each element of A its distance from its nearest neighbor from B (and reciprocally)
+        Distances are computed by blocks of rows of A, so memory is O(block_size * len(B)).
 
         :param A: Distribution A
         :param B: Distribution B
         :param norm: Norm used for distance computations
+        :param block_size: Number of rows of A by block. Default: about 4 million distances by block.
         
         :return: mdA: Distances of A samples nearest neighbors from B
         :return: mdB: Distances of B samples nearest neighbors from A
     """
+    A = np.atleast_2d(np.asarray(A, dtype=np.float64))
+    B = np.atleast_2d(np.asarray(B, dtype=np.float64))
+    if block_size is None:
+        block_size = max(1, 2 ** 22 // max(len(B), 1))
+
     # Minimum distances
-    mdA = [None for _ in range(len(A))]
-    mdB = [None for _ in range(len(B))]
-    
-    for i in range(len(A)):
-        for j in range(len(B)):
-            
-            d = distance(A[i], B[j], norm=norm)
-            
-            if mdA[i] == None or mdA[i] > d:
-                mdA[i] = d
-                
-            if mdB[j] == None or mdB[j] > d:
-                mdB[j] = d
-            
+    mdA = np.full(len(A), np.inf)
+    mdB = np.full(len(B), np.inf)
+
+    for i in range(0, len(A), block_size):
+        D = pairwise_distance(A[i:i + block_size], B, norm=norm)
+        mdA[i:i + block_size] = D.min(axis=1)
+        np.minimum(mdB, D.min(axis=0), out=mdB)
+
     return mdA, mdB
      
 def compute_mda(md, norm='manhattan', precision=0.2, threshold=None, area='simpson'):
@@ -544,17 +651,14 @@ def compute_mda(md, norm='manhattan', precision=0.2, threshold=None, area='simps
     """
     mini, maxi = 0, max(max(md), 1) # min(md)
     
-    if threshold <= 0:
+    if threshold is not None and threshold <= 0:
         print('Warning: threshold must be greater than 0.')
     
     # x axis
     x = np.arange(mini, maxi, precision)
     
-    # y axis
-    y = []
-  
-    for e in x:
-        y.append(sum(1 for i in md if i < e))
+    # y axis: number of minimum distances lower than each x
+    y = np.searchsorted(np.sort(md), x, side='left')
         
     if threshold == None:
         threshold = np.percentile(x, 5) # 5th percentile
@@ -592,13 +696,12 @@ def mmd(x, y):
         :param x: Distribution
         :param y: Distribution
     """
-    input_size = len(x[0])
-    x, y = th.FloatTensor(x), th.FloatTensor(y)
+    x, y = th.FloatTensor(np.asarray(x, dtype=np.float32)), th.FloatTensor(np.asarray(y, dtype=np.float32))
     bandwiths = [0.01, 0.1, 1, 10, 100]
-    s = th.cat([(th.ones([input_size, 1])).div(input_size),
-                    (th.ones([input_size, 1])).div(-input_size)], 0)
+    # Weights of the samples: 1/n for x, -1/m for y
+    s = th.cat([(th.ones([len(x), 1])).div(len(x)),
+                    (th.ones([len(y), 1])).div(-len(y))], 0)
     S = s.mm(s.t())
-    S = Variable(S, requires_grad=False)
     
     X = th.cat([x, y], 0)
     # dot product between all combinations of rows in 'X'
@@ -0,0 +1,30 @@
+# Flat imports of the other code directories from the generators.
+# The directories are located relative to this file, not to the working directory,
+# so the generators import from the repository root, from code/generators or from a notebook.
+# Importing this module adds the functions directory (instrumentation) to the path.
+#
+# Example:
+#   import code_path
+#   import instrumentation
+#   code_path.add('auto_ml', 'processing')
+
+# Imports
+import os
+from sys import path
+
+CODE_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+
+def add(*problem_dirs):
+    """
+        Append directories of the code directory to the path (once).
+
+        :param problem_dirs: Names of the directories ('functions', 'auto_ml', 'processing', ...)
+    """
+    for problem_dir in problem_dirs:
+        problem_dir = os.path.join(CODE_DIR, problem_dir)
+        if problem_dir not in [os.path.normpath(p) for p in path]:
+            path.append(problem_dir)
+
+
+add('functions')
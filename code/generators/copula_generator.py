@@ -1,19 +1,16 @@
-from scipy.stats import gaussian_kde, norm
-from sklearn.preprocessing import LabelEncoder 
+from scipy.stats import norm, rankdata
 from sklearn.neighbors import KernelDensity
+from sklearn.utils import resample, check_random_state
 import numpy as np
+import pandas as pd
+import code_path
+import instrumentation
 
 def vector_to_rank(x):
-    sort = np.sort(x)
-    rank = LabelEncoder().fit_transform(sort) + 1
-    rank_dict = dict(zip(sort, rank))
-    return [rank_dict[i] for i in x]
+    return rankdata(x, method='dense')
 
 def matrix_to_rank(X):
-    matrix = np.copy(X)
-    for i, column in enumerate(matrix.T):
-        matrix[:, i] = vector_to_rank(column)
-    return matrix
+    return rankdata(X, method='dense', axis=0)
 
 def rank_vector_to_inverse(x):
     x = x / (x.max() + 1)
@@ -21,10 +18,7 @@ def rank_vector_to_inverse(x):
     return inverse
 
 def rank_matrix_to_inverse(X):
-    matrix = np.copy(X)
-    for i, column in enumerate(X.T):
-        matrix[:, i] = rank_vector_to_inverse(column)
-    return matrix
+    return norm.ppf(X / (X.max(axis=0) + 1))
 
 def marginal_retrofit(Xartif, Xreal):
     '''Retrofit the marginal distributions of the features in Xartif to those in Xreal'''
@@ -54,15 +48,200 @@ def marginal_retrofit(Xartif, Xreal):
         Xretro[:,i] = Xa        
     return Xretro
 
-def copula_generate(X):
-    print('X marginals to uniforms...')
-    X = matrix_to_rank(X)
-    print('X uniforms to inverse gaussian cdf...')
-    X = rank_matrix_to_inverse(X)
-    print('Gaussian Kernel Density Estimation...')
-    kernel = KernelDensity().fit(X)
-    print('Generating artificial data \n Sampling from KDE distribution...')
-    X_artif = kernel.sample(X.shape[0])
-    print('Marginal retrofitting...')
-    return marginal_retrofit(X_artif, X)
+def quantile_retrofit(U, quantiles):
+    '''Map uniform levels U through the empirical quantile functions given by the sorted real values (one column per feature)'''
+    positions = (np.clip(U, 0, 1) * len(quantiles)).astype(int)
+    positions = np.minimum(positions, len(quantiles) - 1)
+    return np.take_along_axis(quantiles, positions, axis=0)
 
+def latent_cholesky(X, jitter=1e-10):
+    '''Cholesky factor of the correlation matrix of X (constant columns are considered independent)'''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = np.atleast_2d(np.corrcoef(X, rowvar=False))
+    corr = np.nan_to_num(corr)
+    np.fill_diagonal(corr, 1)
+    # Ensure positive definiteness: (corr + jitter * I) / (1 + jitter) is still a correlation matrix,
+    # the latent marginals keep a unit variance (see CopulaGenerator.latent_cdf)
+    shrunk = corr
+    while True:
+        try:
+            return np.linalg.cholesky(shrunk)
+        except np.linalg.LinAlgError:
+            shrunk = (corr + jitter * np.eye(len(corr))) / (1 + jitter)
+            jitter *= 10
+
+class CopulaGenerator():
+    def __init__(self, method='gaussian', **kwargs):
+        """
+            Data generator using a gaussian copula.
+            The model is fitted once and can then be sampled many times.
+
+            :param method: Latent model
+                            'gaussian': multivariate normal with the latent correlation matrix (parametric).
+                                        O(d^2) memory, sampling linear in the number of samples.
+                            'kde': gaussian kernel density estimation on the latent data.
+                                   Samples are training rows plus noise.
+            :param kwargs: KernelDensity parameters (see sklearn doc), 'kde' method only
+        """
+        if method not in ['gaussian', 'kde']:
+            raise ValueError('Argument method is invalid.')
+        self.method = method
+        self.kwargs = kwargs
+
+        # Sorted real values of each column: the empirical quantiles of the marginals
+        self.quantiles = None
+
+        # Column names if the data is a DataFrame
+        self.columns = None
+
+        # Density of the data in the latent (gaussian) space
+        self.kernel = None
+
+        # Cholesky factor of the latent correlation matrix
+        self.cholesky = None
+
+        # Sorted sample of the latent model, empirical marginal cdf for the 'kde' method
+        self.latent_reference = None
+
+    @instrumentation.instrument('CopulaGenerator.fit')
+    def fit(self, X, reference_size=10000):
+        """
+            Fit the marginal ranks and the latent model.
+
+            :param X: Data (ndarray or pd.DataFrame)
+            :param reference_size: Size of the latent sample used to estimate the latent marginals ('kde' method only)
+            :return: self
+        """
+        if isinstance(X, pd.DataFrame):
+            self.columns = X.columns
+        X = np.asarray(X, dtype=np.float64)
+
+        self.quantiles = np.sort(X, axis=0)
+
+        # Marginals to uniforms, uniforms to inverse gaussian cdf
+        latent = rank_matrix_to_inverse(matrix_to_rank(X))
+
+        if self.method == 'gaussian':
+            self.cholesky = latent_cholesky(latent)
+        else:
+            # Gaussian Kernel Density Estimation
+            self.kernel = KernelDensity(**self.kwargs).fit(latent)
+            self.latent_reference = np.sort(self.kernel.sample(reference_size, random_state=0), axis=0)
+        return self
+
+    def sample_latent(self, n, random_state=None):
+        """
+            Sample from the latent model.
+
+            :param n: Number of samples
+            :param random_state: Seed or RandomState
+            :return: Latent samples
+            :rtype: ndarray
+        """
+        if self.kernel is None and self.cholesky is None:
+            raise ValueError('The model is not fitted. Please use the fit method.')
+
+        if self.method == 'gaussian':
+            random_state = check_random_state(random_state)
+            return random_state.standard_normal((n, len(self.cholesky))) @ self.cholesky.T
+        return self.kernel.sample(n, random_state=random_state)
+
+    def retrofit(self, X_artif):
+        """
+            Retrofit the marginal distributions of X_artif to those of the real data.
+            Equivalent to marginal_retrofit, but the precomputed real quantiles are used
+            instead of resampling the real data.
+
+            :param X_artif: Artificial data
+            :return: Retrofitted data
+            :rtype: ndarray
+        """
+        n = X_artif.shape[0]
+
+        # Real quantile at the same rank
+        positions = ((np.arange(n) + 0.5) * len(self.quantiles) / n).astype(int)
+        ranks = np.argsort(np.argsort(X_artif, axis=0), axis=0)
+        return np.take_along_axis(self.quantiles, positions[ranks], axis=0)
+
+    def latent_cdf(self, Z):
+        """
+            Cumulative distribution functions of the latent marginals.
+
+            :param Z: Latent samples
+            :return: Uniform levels
+            :rtype: ndarray
+        """
+        if self.method == 'gaussian':
+            return norm.cdf(Z)
+        U = np.empty(Z.shape)
+        for i in range(Z.shape[1]):
+            U[:, i] = np.searchsorted(self.latent_reference[:, i], Z[:, i]) / len(self.latent_reference)
+        return U
+
+    def sample_chunks(self, n, chunksize=100000, random_state=None):
+        """
+            Generate artificial data chunk by chunk, with constant memory.
+            Latent samples are mapped through the empirical quantile functions of the real marginals,
+            so each chunk is retrofitted independently of the others.
+
+            :param n: Number of samples
+            :param chunksize: Number of samples by chunk
+            :param random_state: Seed or RandomState
+            :return: Generator of chunks (pd.DataFrame if the model was fitted on a DataFrame)
+        """
+        random_state = check_random_state(random_state)
+        for start in range(0, n, chunksize):
+            Z = self.sample_latent(min(chunksize, n - start), random_state=random_state)
+            X_artif = quantile_retrofit(self.latent_cdf(Z), self.quantiles)
+
+            if self.columns is not None:
+                yield pd.DataFrame(X_artif, columns=self.columns, index=range(start, start + len(X_artif)))
+            else:
+                yield X_artif
+
+    def sample_to_file(self, filepath, n, chunksize=100000, random_state=None):
+        """
+            Generate artificial data and stream it to disk (AutoML .data format).
+
+            :param filepath: Path of the output file
+            :param n: Number of samples
+            :param chunksize: Number of samples by chunk
+            :param random_state: Seed or RandomState
+        """
+        with open(filepath, 'w') as f:
+            for chunk in self.sample_chunks(n, chunksize=chunksize, random_state=random_state):
+                np.savetxt(f, np.asarray(chunk), delimiter=' ', fmt='%s')
+
+    @instrumentation.instrument('CopulaGenerator.sample')
+    def sample(self, n, random_state=None):
+        """
+            Generate artificial data.
+
+            :param n: Number of samples
+            :param random_state: Seed or RandomState
+            :return: Generated data (pd.DataFrame if the model was fitted on a DataFrame)
+        """
+        X_artif = self.retrofit(self.sample_latent(n, random_state=random_state))
+
+        if self.columns is not None:
+            return pd.DataFrame(X_artif, columns=self.columns)
+        return X_artif
+
+
+def copula_generate(X, method='kde', verbose=True):
+    """
+        Generate as many artificial rows as X (see CopulaGenerator).
+        Unlike the first version, which retrofitted the samples onto the latent (inverse gaussian cdf)
+        data, the samples are retrofitted onto the real marginals: the output is in the space of X.
+
+        :param X: Data (ndarray or pd.DataFrame)
+        :param method: Latent model, 'kde' (default, as the first version) or 'gaussian'
+        :param verbose: Display the progress
+        :return: Generated data (pd.DataFrame if X is a DataFrame)
+    """
+    if verbose:
+        print('Fitting the copula ({} latent model)...'.format(method))
+    generator = CopulaGenerator(method=method).fit(X)
+    if verbose:
+        print('Generating artificial data and retrofitting the marginals...')
+    return generator.sample(X.shape[0])
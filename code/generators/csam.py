@@ -3,48 +3,18 @@
 Author: Diviyan Kalainathan
 """
 import math
+import hashlib
 import warnings
+import multiprocessing
 import torch as th
 from torch.autograd import Variable
-from torch.utils.data import DataLoader
 from matplotlib import pyplot as plt
-from joblib import Parallel, delayed
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import os
 import pandas as pd
 import numpy as np
-
-
-class CNormalized_Linear(th.nn.Module):
-    """Linear layer with column-wise normalized input matrix."""
-
-    def __init__(self, in_features, out_features, bias=False):
-        """Initialize the layer."""
-        super(CNormalized_Linear, self).__init__()
-        self.in_features = in_features
-        self.out_features = out_features
-        self.weight = th.nn.Parameter(th.Tensor(out_features, in_features))
-        if bias:
-            self.bias = th.nn.Parameter(th.Tensor(out_features))
-        else:
-            self.register_parameter('bias', None)
-        self.reset_parameters()
-
-    def reset_parameters(self):
-        """Reset the parameters."""
-        stdv = 1. / math.sqrt(self.weight.size(1))
-        self.weight.data.uniform_(-stdv, stdv)
-        if self.bias is not None:
-            self.bias.data.uniform_(-stdv, stdv)
-
-    def forward(self, input):
-        """Feed-forward through the network."""
-        return th.nn.functional.linear(input, self.weight.div(self.weight.pow(2).sum(0).sqrt()))
-
-    def __repr__(self):
-        """For print purposes."""
-        return self.__class__.__name__ + '(' \
-            + 'in_features=' + str(self.in_features) \
-            + ', out_features=' + str(self.out_features) \
-            + ', bias=' + str(self.bias is not None) + ')'
+import code_path
+import instrumentation
 
 
 class SAM_discriminator(th.nn.Module):
@@ -78,104 +48,93 @@ class SAM_discriminator(th.nn.Module):
         return self.layers(x)
 
 
-class CFilter(th.nn.Module):
-    def __init__(self, cat_embedding, zero_components, **kwargs):
-        super(CFilter, self).__init__()
-        gpu = kwargs.get('gpu', False)
-        gpu_no = kwargs.get('gpu_no', 0)
+class SAM_fused_generators(th.nn.Module):
+    """Ensemble of all the generators, fused in batched layers.
 
-        self._filter = th.ones(1, len(cat_embedding) + 1)
-        self.cat = [v for c in [cat_embedding, [1]] for v in c]
-
-        for i in zero_components:
-            self._filter[:, i].zero_()
-
-        self.hard_filter = th.cat([f.repeat(i) for f, i
-                                   in zip(th.unbind(self._filter, 1),
-                                          self.cat)], 0).unsqueeze(0)
-        self.hard_filter = Variable(self.hard_filter, requires_grad=False)
-        if gpu:
-            self.hard_filter = self.hard_filter.cuda(gpu_no)
-        self._filter = th.nn.Parameter(self._filter)
-
-    def forward(self, x):
-        cfilter = th.cat([f.repeat(i) for f, i
-                          in zip(th.unbind(self._filter, 1),
-                                 self.cat)], 0).unsqueeze(0)
-        # print(x.shape, cfilter.shape)
-        return x * (self.hard_filter * cfilter).expand_as(x)
-
-
-class SAM_block(th.nn.Module):
-    """SAM-Block: conditional generator.
-    Generates one variable while selecting the parents. Uses filters to do so.
-    One fixed filter and one with parameters on order to keep a fixed skeleton.
+    Generator i is a conditional generator of the ith variable: causal filter
+    on the inputs (fixed by the skeleton and learned), linear layer with
+    column-wise normalized weights, batch norm, activation, linear layer and
+    softmax for categorical variables. All the generators are computed at once
+    with batched matrix products. Outputs of the generators are padded to the
+    largest one-hot size.
     """
 
-    def __init__(self, sizes, cat_embedding, zero_components, **kwargs):
-        """Initialize a generator."""
-        super(SAM_block, self).__init__()
-
+    def __init__(self, data_shape, cat_embedding, zero_components, nh=None, **kwargs):
+        """Init the model."""
+        super(SAM_fused_generators, self).__init__()
         activation_function = kwargs.get('activation_function', th.nn.Tanh)
         activation_argument = kwargs.get('activation_argument', None)
         batch_norm = kwargs.get("batch_norm", False)
-        layers = []
-        self.filter = CFilter(cat_embedding, zero_components, **kwargs)
-
-        for i, j in zip(sizes[:-2], sizes[1:-1]):
-            layers.append(CNormalized_Linear(i, j))
-            if batch_norm:
-                layers.append(th.nn.BatchNorm1d(j))
-            if activation_argument is None:
-                layers.append(activation_function())
-            else:
-                layers.append(activation_function(activation_argument))
-
-        layers.append(th.nn.Linear(sizes[-2], sizes[-1]))
-        self.layers = th.nn.Sequential(*layers)
-        self.cat = sizes[-1] != 1
-        self.softmax = th.nn.Softmax()
-
-    def forward(self, x):
-        """Feed-forward the model."""
-        if self.cat:
-            return self.softmax(self.layers(self.filter(x)))
+        rows, self.cols = data_shape
+        self.nh = nh
+        self.cat_embedding = list(cat_embedding)
+        in_features = sum(cat_embedding) + 1
+        out_features = max(cat_embedding)
+
+        # Filters: one row per generator, one column per variable (+ noise)
+        hard_filter = th.ones(self.cols, self.cols + 1)
+        for i, components in enumerate(zero_components):
+            hard_filter[i, list(components)] = 0
+        self.register_buffer('hard_filter', hard_filter)
+        self._filter = th.nn.Parameter(hard_filter.clone())
+        self.register_buffer('repeats', th.LongTensor(self.cat_embedding + [1]))
+
+        # Layers of the generators
+        self.weight1 = th.nn.Parameter(th.Tensor(self.cols, nh, in_features))
+        self.weight2 = th.nn.Parameter(th.Tensor(self.cols, out_features, nh))
+        self.bias2 = th.nn.Parameter(th.Tensor(self.cols, out_features))
+        self.batch_norm = th.nn.BatchNorm1d(self.cols * nh) if batch_norm else None
+        if activation_argument is None:
+            self.activation = activation_function()
         else:
-            return self.layers(self.filter(x))
+            self.activation = activation_function(activation_argument)
 
+        # Softmax on the valid outputs of categorical generators
+        self.register_buffer('categorical', th.BoolTensor([i != 1 for i in self.cat_embedding]))
+        self.register_buffer('padding', th.arange(out_features).unsqueeze(0)
+                             >= th.LongTensor(self.cat_embedding).unsqueeze(1))
 
-class SAM_generators(th.nn.Module):
-    """Ensemble of all the generators."""
-
-    def __init__(self, data_shape, cat_embedding, zero_components, nh=None, batch_size=-1, **kwargs):
-        """Init the model."""
-        super(SAM_generators, self).__init__()
-        if batch_size == -1:
-            batch_size = data_shape[0]
-        gpu = kwargs.get('gpu', False)
-        gpu_no = kwargs.get('gpu_no', 0)
-        rows, self.cols = data_shape
+        # (generator, output) of each column of the one-hot data
+        self.register_buffer('block_index', th.arange(self.cols).repeat_interleave(self.repeats[:-1]))
+        self.register_buffer('local_index', th.cat([th.arange(i) for i in self.cat_embedding]))
+        self.reset_parameters()
 
-        # building the computation graph
-        self.noise = [Variable(th.FloatTensor(batch_size, 1))
-                      for i in range(self.cols)]
-        if gpu:
-            self.noise = [i.cuda(gpu_no) for i in self.noise]
-        self.blocks = th.nn.ModuleList()
+    def reset_parameters(self):
+        """Reset the parameters."""
+        stdv = 1. / math.sqrt(self.weight1.size(2))
+        self.weight1.data.uniform_(-stdv, stdv)
+        stdv = 1. / math.sqrt(self.weight2.size(2))
+        self.weight2.data.uniform_(-stdv, stdv)
+        self.bias2.data.uniform_(-stdv, stdv)
 
-        # Init all the blocks
-        for i in range(self.cols):
-            self.blocks.append(SAM_block(
-                [sum(cat_embedding) + 1, nh, cat_embedding[i]], cat_embedding, zero_components[i], **kwargs))
+    def filters(self):
+        """Absolute value of the causal filters, A[i,j] for the ith variable and the jth generator."""
+        return self._filter[:, :-1].abs().t()
 
     def forward(self, x):
-        """Feed-forward the model."""
-        for i in self.noise:
-            i.data.normal_()
+        """Feed-forward the model.
+
+        :param x: One-hot data (batch, features)
+        :return: Generated one-hot data (batch, features), generator i
+                 generating the columns of variable i.
+        """
+        batch_size = x.size(0)
+        noise = x.new_empty(self.cols, batch_size, 1).normal_()
+        inputs = th.cat([x.unsqueeze(0).expand(self.cols, batch_size, x.size(1)), noise], 2)
+        cfilter = (self.hard_filter * self._filter).repeat_interleave(self.repeats, dim=1)
+        inputs = inputs * cfilter.unsqueeze(1)
+
+        weight1 = self.weight1.div(self.weight1.pow(2).sum(1, keepdim=True).sqrt())
+        hidden = th.bmm(inputs, weight1.transpose(1, 2))
+        if self.batch_norm is not None:
+            hidden = self.batch_norm(hidden.transpose(0, 1).reshape(batch_size, -1))
+            hidden = hidden.reshape(batch_size, self.cols, self.nh).transpose(0, 1)
+        hidden = self.activation(hidden)
+        output = th.baddbmm(self.bias2.unsqueeze(1), hidden, self.weight2.transpose(1, 2))
 
-        self.generated_variables = [self.blocks[i](
-            th.cat([x, self.noise[i]], 1)) for i in range(self.cols)]
-        return self.generated_variables
+        softmax = th.nn.functional.softmax(output.masked_fill(self.padding.unsqueeze(1), -math.inf), 2)
+        output = th.where(self.categorical.view(-1, 1, 1), softmax, output)
+        return output[self.block_index, :, self.local_index].t()
 
 
 class SAM(object):
@@ -203,13 +162,35 @@ class SAM(object):
         self.test = test_epochs
         self.batchsize = batchsize
 
+    def get_params(self):
+        """Parameters of the SAM constructor."""
+        return dict(lr=self.lr, dlr=self.dlr, l1=self.l1, nh=self.nh, dnh=self.dnh,
+                    train_epochs=self.train, test_epochs=self.test, batchsize=self.batchsize)
+
+    @instrumentation.instrument('SAM.run_SAM')
     def run_SAM(self, df_data, skeleton=None, **kwargs):
         """Execute the SAM model.
         :param df_data:
+        :param checkpoint: Path of the checkpoint file (kwargs, optional).
+                           The training state is saved every checkpoint_period epochs.
+        :param checkpoint_period: Number of epochs between two checkpoints (kwargs, default 100).
+        :param resume: Resume the training from the checkpoint file if it exists (kwargs, default False).
+                       The checkpoint must come from the same data (shape and fingerprint) and parameters.
+        :param early_stopping: Stop the training epochs once the losses and the filters are stable,
+                               then run the test epochs (kwargs, default False).
+                               See ConvergenceMonitor for the other parameters (window, tolerance,
+                               filter_tolerance, patience), given as kwargs too.
         """
         gpu = kwargs.get('gpu', False)
         gpu_no = kwargs.get('gpu_no', 0)
         categorical_variables = kwargs.get('categorical_variables', None)
+        checkpoint = kwargs.pop('checkpoint', None)
+        checkpoint_period = kwargs.pop('checkpoint_period', 100)
+        resume = kwargs.pop('resume', False)
+        monitor = None
+        if kwargs.pop('early_stopping', False):
+            monitor = ConvergenceMonitor(**{k: kwargs.pop(k) for k in ['window', 'tolerance', 'filter_tolerance',
+                                                                        'patience'] if k in kwargs})
 
         verbose = kwargs.get('verbose', True)
         plot = kwargs.get("plot", False)
@@ -217,21 +198,9 @@ class SAM(object):
 
         d_str = "Epoch: {} -- Disc: {} -- Gen: {} -- L1: {}"
 
-        if categorical_variables is None:
-            warnings.warn("Dataset considered as numerical")
-            categorical_variables = [False for i in range(len(df_data.columns))]
-        # list_nodes = list(df_data.columns)
-        onehotdata = []
-        for i, var_is_categorical in enumerate(categorical_variables):
-            if var_is_categorical:
-                onehotdata.append(pd.get_dummies(df_data.iloc[:, i]).as_matrix())
-            else:
-                onehotdata.append(df_data.iloc[:, [i]].as_matrix())
-
-        cat_size = [i.shape[1] for i in onehotdata]
-        # cat_size.append(1)  # Noise
-
-        df_data = np.concatenate(onehotdata, 1)
+        self.layout = None
+        df_data = self.one_hot(df_data, categorical_variables)
+        cat_size = [1 if categories is None else len(categories) for _, categories in self.layout]
 
         data = df_data.astype('float32')
         self.data = df_data
@@ -245,11 +214,13 @@ class SAM(object):
         if skeleton is not None:
             zero_components = [[] for i in range(cols)]
             for i, j in zip(*((1-skeleton).nonzero())):
-                zero_components[j].append(i)
+                # Built-in ints: generators_args is saved with the model (torch.load with weights_only)
+                zero_components[j].append(int(i))
         else:
             zero_components = [[i] for i in range(cols)]
-        self.sam = SAM_generators((rows, cols), cat_size, zero_components,
-                                  batch_norm=True, nh=self.nh, batch_size=self.batchsize, **kwargs)
+        self.generators_args = dict(data_shape=(rows, cols), cat_embedding=cat_size,
+                                    zero_components=zero_components, nh=self.nh)
+        self.sam = SAM_fused_generators(batch_norm=True, **self.generators_args, **kwargs)
 
         # Begin UGLY
         activation_function = kwargs.get('activation_function', th.nn.Tanh)
@@ -278,80 +249,103 @@ class SAM(object):
         true_variable = Variable(
             th.ones(self.batchsize, 1), requires_grad=False)
         false_variable = Variable(
-            th.zeros(self.batchsize, 1), requires_grad=False)
+            th.zeros(cols * self.batchsize, 1), requires_grad=False)
+        generated_target = true_variable.repeat(cols, 1)
         causal_filters = th.zeros(cols, cols)
 
+        # Offsets of the variables in the one-hot data, and substitution
+        # masks: substitution[i] selects the columns of the ith variable
+        offsets = np.cumsum([0] + cat_size)
+        substitution = th.zeros(cols, 1, offsets[-1], dtype=th.bool)
+        for i in range(cols):
+            substitution[i, :, offsets[i]:offsets[i + 1]] = True
+
         if gpu:
             true_variable = true_variable.cuda(gpu_no)
             false_variable = false_variable.cuda(gpu_no)
+            generated_target = generated_target.cuda(gpu_no)
             causal_filters = causal_filters.cuda(gpu_no)
-
-        data_iterator = DataLoader(data, batch_size=self.batchsize, shuffle=True, drop_last=True)
+            substitution = substitution.cuda(gpu_no)
+
+        start_epoch = 0
+        # Number of training epochs, reduced in case of early stopping
+        train_epochs = self.train
+        # Identity of the training run, stored in the checkpoints
+        fingerprint = hashlib.sha1(data.cpu().numpy().tobytes() + repr((self.get_params(), cat_size)).encode() +
+                                   (b'' if skeleton is None else np.asarray(skeleton, dtype='float32').tobytes())).hexdigest()
+        if checkpoint is not None and resume and os.path.exists(checkpoint):
+            # Built-in types and tensors only (see zero_components and ConvergenceMonitor.state_dict)
+            state = th.load(checkpoint, map_location=data.device, weights_only=True)
+            if state.get('data_shape') != tuple(data.shape) or state.get('fingerprint') != fingerprint:
+                raise ValueError('Argument checkpoint is invalid: {} was saved with other data or parameters.'
+                                 .format(checkpoint))
+            self.sam.load_state_dict(state['generators'])
+            self.discriminator_sam.load_state_dict(state['discriminator'])
+            g_optimizer.load_state_dict(state['g_optimizer'])
+            d_optimizer.load_state_dict(state['d_optimizer'])
+            causal_filters.copy_(state['causal_filters'])
+            th.set_rng_state(state['rng_state'])
+            start_epoch = state['epoch']
+            train_epochs = state['train_epochs']
+            if monitor is not None and state['monitor'] is not None:
+                monitor.load_state_dict(state['monitor'])
+            if verbose:
+                print("Resuming from {} at epoch {}".format(checkpoint, start_epoch))
 
         # TRAIN
-        for epoch in range(self.train + self.test):
-            for i_batch, batch in enumerate(data_iterator):
-                batch = Variable(batch)
-                # print(batch.size())
-                unbind_vectors = th.unbind(batch, 1)
-                # print(cat_size)
-                batch_vectors = [th.stack(unbind_vectors[sum(cat_size[:idx]):sum(cat_size[:idx]) + i], 1)
-                                 if i > 1 else unbind_vectors[sum(cat_size[:idx])].unsqueeze(1)
-                                 for idx, i in enumerate(cat_size)]
-                g_optimizer.zero_grad()
-                d_optimizer.zero_grad()
-
+        epoch = start_epoch
+        while epoch < train_epochs + self.test:
+            epoch_losses = [0, 0]
+            # Shuffled batches (last incomplete batch dropped)
+            permutation = th.randperm(rows, device=data.device)
+            for i_batch in range(rows // self.batchsize):
+                batch = data.index_select(0, permutation[i_batch * self.batchsize:
+                                                         (i_batch + 1) * self.batchsize])
                 # Train the discriminator
-                generated_variables = self.sam(batch)
-                # for i in generated_variables:
-                #     print(i.size())
-                # print(batch.size())
-                disc_losses = []
-                gen_losses = []
-                # print([j.size() for j in batch_vectors])
-                # print([j.size() for j in generated_variables])
-
-                for i in range(cols):
-                    generator_output = th.cat([v for c in [batch_vectors[: i], [
-                        generated_variables[i]],
-                        batch_vectors[i + 1:]] for v in c], 1)
-
-                    # 1. Train discriminator on fake
-                    # print(i, generator_output.size())
-                    disc_output_detached = self.discriminator_sam(
-                        generator_output.detach())
-                    disc_output = self.discriminator_sam(generator_output)
-                    disc_losses.append(
-                        criterion(disc_output_detached, false_variable))
-
-                    # 2. Train the generator :
-                    gen_losses.append(criterion(disc_output, true_variable))
+                generated = self.sam(batch)
+
+                # All the substitutions of a variable by its generated
+                # version, stacked in a single batch (cols * batch, features)
+                generator_output = th.where(substitution, generated.unsqueeze(0),
+                                            batch.unsqueeze(0)).reshape(-1, offsets[-1])
 
+                # 1. Discriminator on fake, computed once for all the variables
+                disc_output = self.discriminator_sam(generator_output)
                 true_output = self.discriminator_sam(batch)
-                adv_loss = sum(disc_losses)/cols + \
+                adv_loss = criterion(disc_output, false_variable) + \
                     criterion(true_output, true_variable)
-                gen_loss = sum(gen_losses)
 
-                adv_loss.backward()
-                d_optimizer.step()
+                # 2. Train the generators (on the same discriminator output)
+                gen_loss = cols * criterion(disc_output, generated_target)
+
+                # Discriminator gradients only, the generators are
+                # updated with their own loss
+                d_parameters = list(self.discriminator_sam.parameters())
+                d_gradients = th.autograd.grad(adv_loss, d_parameters, retain_graph=True)
 
                 # 3. Compute filter regularization
-                filters = th.stack(
-                    [i.filter._filter[0, :-1].abs() for i in self.sam.blocks], 1)
+                filters = self.sam.filters()
                 l1_reg = self.l1 * filters.sum()
                 loss = gen_loss + l1_reg
 
                 if verbose and not epoch % 20:
 
-                    print(str(i) + " " + d_str.format(epoch,
-                                                      adv_loss.cpu().item(),
-                                                      gen_loss.cpu(
-                                                      ).item() / cols,
-                                                      l1_reg.cpu().item()))
+                    print(str(i_batch) + " " + d_str.format(epoch,
+                                                            adv_loss.cpu().item(),
+                                                            gen_loss.cpu(
+                                                            ).item() / cols,
+                                                            l1_reg.cpu().item()))
+                g_optimizer.zero_grad()
                 loss.backward()
+                for parameter, gradient in zip(d_parameters, d_gradients):
+                    parameter.grad = gradient
                 # STORE ASSYMETRY values for output
-                if epoch >= self.train:
+                if epoch >= train_epochs:
                     causal_filters.add_(filters.data)
+                elif monitor is not None:
+                    epoch_losses[0] += adv_loss.item()
+                    epoch_losses[1] += gen_loss.item() / cols
+                d_optimizer.step()
                 g_optimizer.step()
 
                 if plot and i_batch == 0:
@@ -395,6 +389,7 @@ class SAM(object):
                     l1_plt.append(l1_reg.cpu().data[0])
 
                 if plot_generated_pair and i_batch == 0:
+                    generated_variables = th.split(generated, cat_size, 1)
                     if epoch == 0:
                         plt.ion()
                         to_print = [[0, 1]]  # , [1, 0]]  # [2, 3]]  # , [11, 17]]
@@ -412,59 +407,276 @@ class SAM(object):
 
                     plt.pause(0.01)
 
+            # Early stopping: the test epochs start after this one
+            if monitor is not None and epoch < train_epochs - 1 and \
+                    monitor.update(epoch, epoch_losses[0] / (rows // self.batchsize),
+                                   epoch_losses[1] / (rows // self.batchsize), filters.data.cpu().numpy()):
+                train_epochs = epoch + 1
+                monitor.log[-1]['saved_epochs'] = self.train - train_epochs
+                if verbose:
+                    print(monitor.log[-1]['message'] + ', {} epochs saved'.format(self.train - train_epochs))
+
+            epoch += 1
+            if checkpoint is not None and (not epoch % checkpoint_period
+                                           or epoch == train_epochs + self.test):
+                save_checkpoint(checkpoint, {
+                    'data_shape': tuple(data.shape),
+                    'fingerprint': fingerprint,
+                    'epoch': epoch,
+                    'train_epochs': train_epochs,
+                    'monitor': None if monitor is None else monitor.state_dict(),
+                    'generators': self.sam.state_dict(),
+                    'discriminator': self.discriminator_sam.state_dict(),
+                    'g_optimizer': g_optimizer.state_dict(),
+                    'd_optimizer': d_optimizer.state_dict(),
+                    'causal_filters': causal_filters,
+                    'rng_state': th.get_rng_state()})
+
+        self.stopping_log = [] if monitor is None else monitor.log
         return causal_filters.div_(self.test).cpu().numpy()
 
+    def save(self, path, data=False):
+        """Save the parameters, the trained generators and the one-hot layout (variables and category levels).
+        :param path: Path of the output file
+        :param data: If True, also save the (one-hot) training data, used by generate_batches without df_data.
+                     Off by default: the file would contain the real records.
+        """
+        th.save({'parameters': self.get_params(),
+                 'generators_args': self.generators_args,
+                 'generators': self.sam.state_dict(),
+                 'layout': self.layout,
+                 'data': th.from_numpy(np.asarray(self.data, dtype='float32')) if data else None}, path)
+
+    @classmethod
+    def load(cls, path, gpu=False, gpu_no=0):
+        """Load a SAM model saved with the save method, ready to generate.
+        :param path: Path of the file
+        :return: SAM object
+        """
+        state = th.load(path, map_location='cpu', weights_only=True)
+        model = cls(**state['parameters'])
+        model.generators_args = state['generators_args']
+        model.sam = SAM_fused_generators(batch_norm=True, **model.generators_args)
+        model.sam.load_state_dict(state['generators'])
+        model.layout = state['layout']
+        model.data = None if state['data'] is None else state['data'].numpy()
+        if gpu:
+            model.sam = model.sam.cuda(gpu_no)
+        return model
+
+    @instrumentation.instrument('SAM.predict')
     def predict(self, data, categorical_variables=None, skeleton=None, nruns=1, njobs=1, gpus=0, verbose=True,
-                plot=False, plot_generated_pair=False):
+                plot=False, plot_generated_pair=False, seed=None, checkpoint=None, resume=False):
         """Execute SAM on a dataset given a skeleton or not.
         :param data: Observational data for estimation of causal relationships by SAM
         :param skeleton: A priori knowledge about the causal relationships as an adjacency matrix.
                          Can be fed either directed or undirected links.
         :param nruns: Number of runs to be made for causal estimation.
                       Recommended: >=12 for optimal performance.
-        :param njobs: Numbers of jobs to be run in Parallel.
+        :param njobs: Numbers of jobs to be run in Parallel (one process per job).
                       Recommended: 1 if no GPU available, 2*number of GPUs else.
+                      With njobs > 1, the CPU threads are shared between the jobs and
+                      the trained generators are not kept (see generate). The jobs run in spawned
+                      processes: a calling script must be guarded by if __name__ == '__main__'.
         :param gpus: Number of available GPUs for the algorithm.
         :param verbose: verbose mode
         :param plot: Plot losses interactively. Not recommended if nruns>1
         :param plot_generated_pair: plots a generated pair interactively.  Not recommended if nruns>1
+        :param seed: Seed from which the seed of each run is drawn.
+        :param checkpoint: Prefix of the checkpoint files (one file per run, see run_SAM).
+        :param resume: Resume interrupted runs from their checkpoint (same data and parameters only).
         :return: Adjacency matrix (A) of the graph estimated by SAM,
                 A[i,j] is the term of the ith variable for the jth generator.
         """
-        list_out = []
-        for i in range(nruns):
-            list_out.append(self.run_SAM(data,
-                                         categorical_variables=categorical_variables,
-                                         skeleton=skeleton,                            gpu=bool(gpus),
-                                         plot=plot, verbose=verbose, gpu_no=0))
-
-        W = list_out[0]
-        for w in list_out[1:]:
-            W += w
-        W /= nruns
+        seeds = np.random.RandomState(seed).randint(2 ** 31 - 1, size=nruns)
+        kwargs = [dict(categorical_variables=categorical_variables, skeleton=skeleton,
+                       gpu=bool(gpus), gpu_no=i % gpus if gpus else 0, plot=plot,
+                       plot_generated_pair=plot_generated_pair, verbose=verbose,
+                       checkpoint=None if checkpoint is None else '{}.{}'.format(checkpoint, i), resume=resume)
+                  for i in range(nruns)]
+
+        # Running average of the causal filters, updated as the runs end
+        W = 0
+        if njobs == 1:
+            for i in range(nruns):
+                th.manual_seed(seeds[i])
+                W += (self.run_SAM(data, **kwargs[i]) - W) / (i + 1)
+        else:
+            nthreads = max(1, (os.cpu_count() or 1) // njobs)
+            # Spawned workers: forking after torch (or CUDA) is initialized may deadlock
+            with ProcessPoolExecutor(max_workers=njobs, mp_context=multiprocessing.get_context('spawn')) as executor:
+                runs = [executor.submit(_run_SAM_job, self.get_params(), data, seeds[i], nthreads, kwargs[i])
+                        for i in range(nruns)]
+                for i, run in enumerate(as_completed(runs)):
+                    W += (run.result() - W) / (i + 1)
         return W
 
+    def one_hot(self, df_data, categorical_variables=None):
+        """One-hot encode the categorical variables.
+        The layout (categories of each variable) is computed once and cached,
+        so that data encoded later has the same columns as the training data.
+        :param df_data: pandas DataFrame
+        :param categorical_variables: List of booleans, True for categorical variables (first call only)
+        :return: One-hot data
+        :rtype: ndarray
+        """
+        if getattr(self, 'layout', None) is None:
+            if categorical_variables is None:
+                warnings.warn("Dataset considered as numerical")
+                categorical_variables = [False for i in range(len(df_data.columns))]
+            self.layout = [(column, pd.Categorical(df_data[column]).categories.tolist() if var_is_categorical else None)
+                           for column, var_is_categorical in zip(df_data.columns.tolist(), categorical_variables)]
+
+        onehotdata = []
+        for i, (_, categories) in enumerate(self.layout):
+            if categories is not None:
+                onehotdata.append(pd.get_dummies(pd.Categorical(df_data.iloc[:, i], categories=categories)).values)
+            else:
+                onehotdata.append(df_data.iloc[:, [i]].values)
+        return np.concatenate(onehotdata, 1).astype('float32')
+
+    def decode(self, onehotdata, index=None):
+        """Decode one-hot data: categorical variables are mapped back to their
+        category labels (argmax of the generated probabilities).
+        :param onehotdata: One-hot data (ndarray)
+        :param index: Index of the output DataFrame
+        :return: Decoded data
+        :rtype: pd.DataFrame
+        """
+        offsets = np.cumsum([0] + self.generators_args['cat_embedding'])
+        columns = dict()
+        for i, (column, categories) in enumerate(self.layout):
+            values = onehotdata[:, offsets[i]:offsets[i + 1]]
+            if categories is None:
+                columns[column] = values[:, 0]
+            else:
+                columns[column] = np.asarray(categories, dtype=object)[values.argmax(1)]
+        return pd.DataFrame(columns, index=index, columns=[column for column, _ in self.layout])
+
+    def generate_batches(self, n_samples, batch_size=1000, df_data=None, seed=None):
+        """Generate data by batches, with the trained generators.
+        Each generated row is conditioned on a row of the data, drawn at random.
+        :param n_samples: Number of samples to generate
+        :param batch_size: Number of samples by batch
+        :param df_data: Conditioning data (pandas DataFrame). Default: training data
+                        (required after load, unless the model was saved with its data).
+        :param seed: Seed of the random row selection and of the noise
+        :return: Generator of decoded pandas DataFrames (categorical variables as their category labels)
+        """
+        device = self.sam.hard_filter.device
+        if df_data is None and self.data is None:
+            raise ValueError('Argument df_data is invalid: the model was saved without its training data.')
+        data = self.data if df_data is None else self.one_hot(df_data)
+        data = th.from_numpy(np.asarray(data, dtype='float32')).to(device)
+        random_state = np.random.RandomState(seed)
+        if seed is not None:
+            th.manual_seed(seed)
+        training = self.sam.training
+        # Batch norm with the running statistics: any batch size
+        self.sam.eval()
+        try:
+            with th.no_grad():
+                for start in range(0, n_samples, batch_size):
+                    rows = random_state.randint(len(data), size=min(batch_size, n_samples - start))
+                    generated = self.sam(data[th.from_numpy(rows).to(device)]).cpu().numpy()
+                    yield self.decode(generated, index=range(start, start + len(rows)))
+        finally:
+            self.sam.train(training)
+
     def generate(self, df_data, categorical_variables=None, **kwargs):
         gpu = kwargs.get('gpu', False)
         gpu_no = kwargs.get('gpu_no', 0)
-        if categorical_variables is None:
-            warnings.warn("Dataset considered as numerical")
-            categorical_variables = [False for i in range(len(df_data.columns))]
-        # list_nodes = list(df_data.columns)
-        onehotdata = []
-        for i, var_is_categorical in enumerate(categorical_variables):
-            if var_is_categorical:
-                onehotdata.append(pd.get_dummies(df_data.iloc[:, i]).as_matrix())
-            else:
-                onehotdata.append(df_data.iloc[:, [i]].as_matrix())
+        data = th.from_numpy(self.one_hot(df_data, categorical_variables))
+        if gpu:
+            data = data.cuda(gpu_no)
+        return list(th.split(self.sam(data), self.generators_args['cat_embedding'], 1))
 
-        cat_size = [i.shape[1] for i in onehotdata]
-        # cat_size.append(1)  # Noise
+class ConvergenceMonitor(object):
+    """Convergence criterion for the early stopping of SAM.
 
-        df_data = np.concatenate(onehotdata, 1)
+    The losses and the filters are smoothed by exponential moving averages;
+    the training has converged when, during `patience` consecutive epochs,
+    the relative variations of the averaged losses are below `tolerance` and
+    the maximum variation of the averaged filters is below `filter_tolerance`.
+    """
 
-        data = df_data.astype('float32')
-        data = th.from_numpy(data)
-        if gpu:
-            data = data.cuda(gpu_no)
-        return self.sam(data)
+    def __init__(self, window=20, tolerance=1e-3, filter_tolerance=5e-3, patience=50):
+        """Init the monitor.
+        :param window: Span (in epochs) of the moving averages
+        :param tolerance: Threshold on the relative variation of the averaged losses
+        :param filter_tolerance: Threshold on the maximum variation of the filters
+        :param patience: Number of consecutive stable epochs before stopping
+        """
+        self.alpha = 2. / (window + 1)
+        self.tolerance = tolerance
+        self.filter_tolerance = filter_tolerance
+        self.patience = patience
+        self.averages = None
+        self.filters = None
+        self.stable_epochs = 0
+        # Decisions, for audit purposes
+        self.log = []
+
+    def update(self, epoch, adv_loss, gen_loss, filters):
+        """Update the monitor with the values of an epoch.
+        :return: True if the training has converged
+        """
+        losses = np.array([adv_loss, gen_loss])
+        filters = np.array(filters)
+        if self.averages is None:
+            self.averages, self.filters = losses, filters
+            return False
+
+        averages = self.averages + self.alpha * (losses - self.averages)
+        filters = self.filters + self.alpha * (filters - self.filters)
+        loss_change = float(np.max(np.abs(averages - self.averages) / np.maximum(np.abs(self.averages), 1e-12)))
+        filter_change = float(np.max(np.abs(filters - self.filters)))
+        self.averages, self.filters = averages, filters
+
+        if loss_change < self.tolerance and filter_change < self.filter_tolerance:
+            self.stable_epochs += 1
+        else:
+            self.stable_epochs = 0
+
+        if self.stable_epochs >= self.patience:
+            self.log.append({'epoch': epoch, 'disc_loss': float(averages[0]), 'gen_loss': float(averages[1]),
+                             'loss_change': loss_change, 'filter_change': filter_change,
+                             'message': 'Early stopping at epoch {}: losses and filters stable '
+                                        'for {} epochs (loss change {:.2e}, filter change {:.2e})'.format(
+                                            epoch, self.stable_epochs, loss_change, filter_change)})
+            return True
+        return False
+
+    def state_dict(self):
+        """State of the monitor, with built-in types only (for checkpoints)."""
+        state = dict(self.__dict__)
+        if self.averages is not None:
+            state['averages'] = self.averages.tolist()
+            state['filters'] = self.filters.tolist()
+        return state
+
+    def load_state_dict(self, state):
+        """Restore a state given by state_dict."""
+        self.__dict__.update(state)
+        if self.averages is not None:
+            self.averages = np.array(self.averages)
+            self.filters = np.array(self.filters)
+
+
+def save_checkpoint(path, state):
+    """Save a training state, replacing the previous checkpoint atomically."""
+    th.save(state, path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+
+def _run_SAM_job(parameters, data, seed, nthreads, kwargs):
+    """Execute one SAM run in a worker process.
+    :param parameters: Parameters of the SAM constructor
+    :param seed: Seed of the run
+    :param nthreads: Number of torch threads of the worker
+    :return: Causal filters of the run
+    """
+    th.set_num_threads(nthreads)
+    th.manual_seed(seed)
+    np.random.seed(seed)
+    return SAM(**parameters).run_SAM(data, **kwargs)
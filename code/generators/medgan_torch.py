@@ -0,0 +1,771 @@
+import argparse
+import torch as th
+import torch.nn as nn
+import numpy as np
+import pandas as pd
+import os
+import queue
+import threading
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import roc_auc_score
+import code_path
+import instrumentation
+
+_VALIDATION_RATIO = 0.1
+
+
+def loadAutoML(inputDir=None):
+    """
+        Import the AutoML layer on demand (the command line interface does not need it).
+
+        :param inputDir: AutoML directory ('<basename>_automl' or containing '<basename>.data').
+        :return: AutoML object loaded from inputDir, or AutoML class if inputDir is None.
+    """
+    code_path.add('auto_ml', 'processing')
+    from auto_ml import AutoML
+
+    if inputDir is None:
+        return AutoML
+    inputDir = os.path.normpath(inputDir)
+    basename = os.path.basename(inputDir)
+    if basename.endswith('_automl'):
+        basename = basename[:-len('_automl')]
+    else:
+        basename = [f[:-len('.data')] for f in sorted(os.listdir(inputDir))
+                    if f.endswith('.data') and not f.endswith(('_train.data', '_test.data'))] or \
+                   [f[:-len('_train.data')] for f in sorted(os.listdir(inputDir)) if f.endswith('_train.data')]
+        if not basename:
+            raise OSError('No .data files in {}.'.format(inputDir))
+        basename = basename[0]
+    return AutoML(inputDir, basename)
+
+
+class BatchSampler(object):
+    def __init__(self, data, batchSize):
+        """
+            Infinite sampler of random batches over data held on the compute device.
+            The permutation of a whole pass is drawn at once on the device, so
+            each batch is a single index_select, without host round-trip.
+            Rows are not repeated within a pass (sampling without replacement).
+
+            :param data: Data (torch tensor)
+            :param batchSize: Size of the batches (bounded by the number of rows)
+        """
+        self.data = data
+        self.batchSize = min(batchSize, len(data))
+        self.permutation = None
+        self.position = len(data)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.position + self.batchSize > len(self.data):
+            self.permutation = th.randperm(len(self.data), device=self.data.device)
+            self.position = 0
+        idx = self.permutation[self.position:self.position + self.batchSize]
+        self.position += self.batchSize
+        return self.data.index_select(0, idx)
+
+
+class LogWriter(object):
+    def __init__(self, outFile, bufferSize=64):
+        """
+            Buffered log file, written by a background thread.
+            The file is opened once and lines are flushed by blocks of bufferSize,
+            so logging does not block the training loop.
+
+            :param outFile: Path of the log file (lines are appended)
+            :param bufferSize: Number of lines written at once
+        """
+        self.outFile = outFile
+        self.bufferSize = bufferSize
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        with open(self.outFile, 'a') as outfd:
+            buffer = []
+            while True:
+                buf = self.queue.get()
+                if buf is not None:
+                    buffer.append(buf + '\n')
+                if buffer and (buf is None or len(buffer) >= self.bufferSize or self.queue.empty()):
+                    outfd.writelines(buffer)
+                    buffer = []
+                if buf is None:
+                    return
+
+    def write(self, buf):
+        self.queue.put(buf)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CheckpointPolicy(object):
+    def __init__(self, outPath, saveEvery=1, saveMaxKeep=0, saveBest=False):
+        """
+            Decide which checkpoints of the training are written and kept.
+
+            :param outPath: Prefix of the checkpoint files ('<outPath>-<epoch>', '<outPath>-best')
+            :param saveEvery: Save a checkpoint every saveEvery epochs (the last epoch is always saved). 0 to disable.
+            :param saveMaxKeep: Number of periodic checkpoints to keep (the last ones). 0 to keep them all.
+            :param saveBest: If True, also keep the best model: validation AUC of the discriminator closest to 0.5
+                             (the discriminator cannot tell real and generated records apart).
+        """
+        self.outPath = outPath
+        self.saveEvery = saveEvery
+        self.saveMaxKeep = saveMaxKeep
+        self.saveBest = saveBest
+        self.saved = []
+        self.bestScore = None
+        self.bestPath = '{}-best'.format(outPath)
+
+    def update(self, model, epoch, last=False, auc=None):
+        """
+            Save the checkpoints of an epoch according to the policy.
+
+            :param model: Medgan object
+            :param epoch: Epoch
+            :param last: If True, the epoch is the last one
+            :param auc: Validation AUC of the epoch, None if not evaluated
+            :return: Path of the saved periodic checkpoint (None if not saved)
+        """
+        savePath = None
+        if last or (self.saveEvery > 0 and (epoch + 1) % self.saveEvery == 0):
+            savePath = os.path.join(os.getcwd(), '{}-{}'.format(self.outPath, epoch))
+            th.save(model.state_dict(), savePath)
+            self.saved.append(savePath)
+            if self.saveMaxKeep > 0:
+                while len(self.saved) > self.saveMaxKeep:
+                    oldPath = self.saved.pop(0)
+                    if os.path.exists(oldPath):
+                        os.remove(oldPath)
+
+        if self.saveBest and auc is not None and (self.bestScore is None or abs(auc - 0.5) < self.bestScore):
+            self.bestScore = abs(auc - 0.5)
+            th.save(model.state_dict(), self.bestPath)
+        return savePath
+
+
+class Autoencoder(nn.Module):
+    def __init__(self, inputDim, compressDims, decompressDims, dataType):
+        super(Autoencoder, self).__init__()
+        self.dataType = dataType
+        aeActivation = nn.Sigmoid if dataType == 'binary' else nn.ReLU
+
+        layers = []
+        tempDim = inputDim
+        # default is compressDims = [128]
+        for compressDim in compressDims:
+            layers += [nn.Linear(tempDim, compressDim), aeActivation()]
+            tempDim = compressDim
+        self.encoder = nn.Sequential(*layers)
+
+        layers = []
+        # default is decompressDims[:-1] = []
+        for decompressDim in decompressDims[:-1]:
+            layers += [nn.Linear(tempDim, decompressDim), aeActivation()]
+            tempDim = decompressDim
+        layers += [nn.Linear(tempDim, decompressDims[-1]),
+                   nn.Sigmoid() if dataType == 'binary' else nn.ReLU()]
+        self.decoder = nn.Sequential(*layers)
+
+    def loss(self, x_input):
+        tempVec = self.encoder(x_input)
+        x_reconst = self.decoder(tempVec)
+
+        if self.dataType == 'binary':
+            # implement sparse autoencoder
+            def kl_divergence(rho, rho_hat):
+                return rho * np.log(rho) - rho * th.log(rho_hat + 1e-12) + \
+                       (1 - rho) * np.log(1 - rho) - \
+                       (1 - rho) * th.log(1 - rho_hat + 1e-12)
+
+            # sparsity parameter
+            rho = 0.01
+            # calculate kl loss portion
+            rho_hat = tempVec.mean(0)
+            kl = kl_divergence(rho, rho_hat)
+            beta = 3
+            return th.mean(-th.sum(x_input * th.log(x_reconst + 1e-12) + (1. - x_input) * th.log(
+                1. - x_reconst + 1e-12), 1), 0) + beta * th.sum(kl)
+        return th.mean((x_input - x_reconst)**2)
+
+
+class Generator(nn.Module):
+    def __init__(self, randomDim, generatorDims, dataType, bnDecay):
+        super(Generator, self).__init__()
+        self.layers = nn.ModuleList()
+        self.norms = nn.ModuleList()
+        tempDim = randomDim
+        for genDim in generatorDims:
+            self.layers.append(nn.Linear(tempDim, genDim, bias=False))
+            # Same moving average and epsilon as tf batch_norm
+            self.norms.append(nn.BatchNorm1d(genDim, eps=1e-3, momentum=1 - bnDecay))
+            tempDim = genDim
+        self.outputActivation = th.tanh if dataType == 'binary' else th.relu
+
+    def forward(self, x_input):
+        tempVec = x_input
+        for i, (layer, norm) in enumerate(zip(self.layers, self.norms)):
+            h = norm(layer(tempVec))
+            if i < len(self.layers) - 1:
+                h = th.relu(h)
+            else:
+                h = self.outputActivation(h)
+            # residual connections
+            tempVec = h + tempVec
+        return tempVec
+
+
+class Discriminator(nn.Module):
+    def __init__(self, inputDim, discriminatorDims, keepRate=1.0):
+        super(Discriminator, self).__init__()
+        layers = []
+        tempDim = inputDim * 2
+        for discDim in discriminatorDims[:-1]:
+            layers += [nn.Linear(tempDim, discDim), nn.ReLU(), nn.Dropout(1 - keepRate)]
+            tempDim = discDim
+        layers += [nn.Linear(tempDim, 1), nn.Sigmoid()]
+        self.layers = nn.Sequential(*layers)
+
+    def forward(self, x_input):
+        # minibatch averaging: each record is concatenated with the mean record of the batch
+        inputMeanCol = x_input.mean(0, keepdim=True).expand_as(x_input)
+        return self.layers(th.cat([x_input, inputMeanCol], 1)).squeeze(1)
+
+
+class Medgan(object):
+    def __init__(self,
+                 dataType='binary',
+                 inputDim=615,
+                 embeddingDim=128,
+                 randomDim=128,
+                 generatorDims=(128, 128),
+                 discriminatorDims=(256, 128, 1),
+                 compressDims=(),
+                 decompressDims=(),
+                 bnDecay=0.99,
+                 l2scale=0.001,
+                 device=None):
+        """
+            medGAN (same architecture as medgan.py) with a torch backend.
+            Data is transferred once to the compute device, batches are drawn there
+            (see BatchSampler) and the noise is generated on the device.
+
+            :param device: Compute device (torch device or str). Default: cuda if available, otherwise cpu.
+        """
+        self.inputDim = inputDim
+        self.embeddingDim = embeddingDim
+        self.generatorDims = list(generatorDims) + [embeddingDim]
+        self.randomDim = randomDim
+        self.dataType = dataType
+
+        self.discriminatorDims = discriminatorDims
+        self.compressDims = list(compressDims) + [embeddingDim]
+        self.decompressDims = list(decompressDims) + [inputDim]
+        self.bnDecay = bnDecay
+        self.l2scale = l2scale
+
+        # Column names, if trained on an AutoML dataset
+        self.columns = None
+
+        if device is None:
+            device = 'cuda' if th.cuda.is_available() else 'cpu'
+        self.device = th.device(device)
+
+        self.autoencoder = Autoencoder(self.inputDim, self.compressDims, self.decompressDims,
+                                       self.dataType).to(self.device)
+        self.generator = Generator(self.randomDim, self.generatorDims, self.dataType,
+                                   self.bnDecay).to(self.device)
+        self.discriminator = Discriminator(self.inputDim, self.discriminatorDims).to(self.device)
+
+        self.optimize_ae = th.optim.Adam(self.autoencoder.parameters())
+        self.optimize_d = th.optim.Adam(self.discriminator.parameters())
+        self.optimize_g = th.optim.Adam(list(self.generator.parameters()) +
+                                        list(self.autoencoder.decoder.parameters()))
+
+    def loadData(self, dataPath=''):
+        """
+            Load the training and validation data.
+
+            :param dataPath: Path of a .npy patient matrix (split in train/validation),
+                             or AutoML object, or AutoML directory. The processed X matrix of
+                             the AutoML dataset is used (cached by AutoML), with its own
+                             train/test split. Please process it with binary or count
+                             variables only (e.g. process_data(norm=None, code='one-hot')).
+            :return: Tuple (trainX, validX)
+            :rtype: Tuple
+        """
+        if isinstance(dataPath, str) and os.path.isdir(dataPath):
+            dataPath = loadAutoML(dataPath)
+
+        if isinstance(dataPath, str):
+            full_data = np.load(dataPath)
+            trainX, validX = train_test_split(
+                full_data, test_size=_VALIDATION_RATIO, random_state=0)
+        else:
+            trainX = dataPath.get_array('X_train', processed=True)
+            validX = dataPath.get_array('X_test', processed=True)
+            self.columns = dataPath.get_data('X', processed=True, verbose=False).columns
+
+        if trainX.shape[1] != self.inputDim:
+            raise ValueError('Argument inputDim is invalid: the data has {} columns.'.format(trainX.shape[1]))
+
+        if self.dataType == 'binary':
+            if isinstance(dataPath, str):
+                # Patient matrix: counts truncated to presence (as the original medGAN)
+                trainX, validX = np.clip(trainX, 0, 1), np.clip(validX, 0, 1)
+            else:
+                # AutoML data: label codes or scaled values would be destroyed by clipping
+                invalid = [c for k, c in enumerate(self.columns)
+                           if not np.isin(np.unique(np.concatenate([trainX[:, k], validX[:, k]])), [0, 1]).all()]
+                if invalid:
+                    raise ValueError('Argument dataPath is invalid: binary data type but non binary columns {}. '
+                                     'Please process with process_data(norm=None, code=\'one-hot\') '
+                                     'or use the count data type.'.format(invalid))
+
+        return trainX, validX
+
+    def toDevice(self, X):
+        return th.as_tensor(np.asarray(X, dtype=np.float32)).to(self.device)
+
+    def regularization(self, *modules):
+        """ L2 regularization of the weights of the given modules (tf l2_regularizer: scale * sum(w ** 2) / 2).
+        """
+        return self.l2scale * sum((p ** 2).sum() for m in modules for p in m.parameters()) / 2
+
+    def randomX(self, batchSize):
+        return th.randn(batchSize, self.randomDim, device=self.device)
+
+    def losses(self, x_real, randomX):
+        # Decompress, then discriminate for fake samples
+        x_decoded = self.autoencoder.decoder(self.generator(randomX))
+        y_hat_real = self.discriminator(x_real)
+        y_hat_fake = self.discriminator(x_decoded)
+
+        loss_d = -th.mean(th.log(y_hat_real + 1e-12)) - th.mean(th.log(1. - y_hat_fake + 1e-12))
+        loss_g = -th.mean(th.log(y_hat_fake + 1e-12))
+        return loss_d, loss_g, y_hat_real, y_hat_fake
+
+    def state_dict(self):
+        return {'autoencoder': self.autoencoder.state_dict(),
+                'generator': self.generator.state_dict(),
+                'discriminator': self.discriminator.state_dict(),
+                'optimize_ae': self.optimize_ae.state_dict(),
+                'optimize_d': self.optimize_d.state_dict(),
+                'optimize_g': self.optimize_g.state_dict()}
+
+    def restore(self, modelFile):
+        state = th.load(modelFile, map_location=self.device)
+        for name in ['autoencoder', 'generator', 'discriminator', 'optimize_ae', 'optimize_d', 'optimize_g']:
+            getattr(self, name).load_state_dict(state[name])
+
+    @staticmethod
+    def print2file(buf, outFile):
+        outfd = open(outFile, 'a')
+        outfd.write(buf + '\n')
+        outfd.close()
+
+    @instrumentation.instrument('Medgan.generateData')
+    def generateData(self,
+                     nSamples=100,
+                     modelFile='model',
+                     batchSize=100,
+                     outFile='out',
+                     burnIn=1000):
+        """
+            Generate synthetic records and write them to a .npy file, batch by batch.
+            The output file is preallocated (memory-mapped) with its exact shape,
+            so memory does not grow with nSamples.
+
+            :param nSamples: Number of records (the last batch may be partial)
+            :param modelFile: Model to restore. None to use the current model.
+            :param batchSize: Size of the batches
+            :param outFile: Path of the output file ('.npy' is appended if missing)
+            :param burnIn: Number of batches run with batch norm in training mode before generating,
+                           to update its moving averages. 0 to skip.
+            :return: Path of the output file
+            :rtype: str
+        """
+        th.manual_seed(1234)
+        if modelFile is not None:
+            self.restore(modelFile)
+        if not outFile.endswith('.npy'):
+            outFile += '.npy'
+        outputMat = np.lib.format.open_memmap(outFile, mode='w+', dtype=np.float32,
+                                              shape=(nSamples, self.inputDim))
+        with th.no_grad():
+            if burnIn > 0:
+                # batch norm in training mode: updates the moving averages
+                print('burning in')
+                self.generator.train()
+                for i in range(burnIn):
+                    _ = self.generator(self.randomX(batchSize))
+
+            print('generating')
+            self.generator.eval()
+            for i in range(0, nSamples, batchSize):
+                output = self.autoencoder.decoder(self.generator(self.randomX(min(batchSize, nSamples - i))))
+                outputMat[i:i + len(output)] = output.cpu().numpy()
+
+        outputMat.flush()
+        del outputMat
+        return outFile
+
+    def generateToAutoML(self,
+                         outputDir,
+                         basename,
+                         nSamples=100,
+                         modelFile=None,
+                         batchSize=100,
+                         burnIn=1000):
+        """
+            Generate synthetic records as an AutoML dataset, e.g. for the Comparator.
+            Binary records are rounded to 0/1. Columns are named as the training AutoML
+            dataset if the model was trained on one.
+
+            :param outputDir: The directory where the autoML files will be stored.
+            :param basename: The name of the generated dataset.
+            :param modelFile: Model to restore. None to use the current model.
+            :return: AutoML object
+        """
+        if not os.path.isdir(outputDir):
+            os.makedirs(outputDir)
+        outFile = self.generateData(nSamples=nSamples, modelFile=modelFile, batchSize=batchSize,
+                                    outFile=os.path.join(outputDir, basename + '_generated.npy'),
+                                    burnIn=burnIn)
+        X = np.load(outFile, mmap_mode='r')
+        if self.dataType == 'binary':
+            X = np.round(X)
+        X = pd.DataFrame(X, columns=self.columns)
+        os.remove(outFile)
+        return loadAutoML().from_df(outputDir, basename, X)
+
+    @staticmethod
+    def calculateDiscAuc(preds_real, preds_fake):
+        preds = np.concatenate([preds_real, preds_fake], axis=0)
+        labels = np.concatenate(
+            [np.ones((len(preds_real))), np.zeros((len(preds_fake)))], axis=0)
+        auc = roc_auc_score(labels, preds)
+        return auc
+
+    @staticmethod
+    def calculateDiscAccuracy(preds_real, preds_fake):
+        total = len(preds_real) + len(preds_fake)
+        hit = np.sum(np.asarray(preds_real) > 0.5) + np.sum(np.asarray(preds_fake) < 0.5)
+        acc = float(hit) / float(total)
+        return acc
+
+    def validate(self, validX, batchSize=1000):
+        """
+            Evaluate the discriminator on the whole validation set (in fixed batches),
+            against as many generated records.
+
+            :param validX: Validation data (torch tensor)
+            :param batchSize: Size of the batches
+            :return: Tuple (accuracy, AUC), computed once over all the predictions
+            :rtype: Tuple
+        """
+        training = self.generator.training, self.discriminator.training
+        self.generator.eval()
+        self.discriminator.eval()
+        preds_real, preds_fake = [], []
+        with th.no_grad():
+            for i in range(0, len(validX), batchSize):
+                batchX = validX[i:i + batchSize]
+                _, _, y_hat_real, y_hat_fake = self.losses(batchX, self.randomX(len(batchX)))
+                preds_real.append(y_hat_real)
+                preds_fake.append(y_hat_fake)
+        self.generator.train(training[0])
+        self.discriminator.train(training[1])
+        preds_real = th.cat(preds_real).cpu().numpy()
+        preds_fake = th.cat(preds_fake).cpu().numpy()
+        return self.calculateDiscAccuracy(preds_real, preds_fake), self.calculateDiscAuc(preds_real, preds_fake)
+
+    def pretrain(self, trainX, validX, log, pretrainBatchSize, pretrainEpochs):
+        trainBatches = BatchSampler(trainX, pretrainBatchSize)
+        # small datasets (AutoML): at least one batch
+        nTrainBatches = int(np.ceil(float(trainX.shape[0]) / float(pretrainBatchSize)))
+
+        for epoch in range(pretrainEpochs):
+            trainLossVec = []
+            for i in range(nTrainBatches):
+                self.optimize_ae.zero_grad()
+                loss = self.autoencoder.loss(next(trainBatches))
+                (loss + self.regularization(self.autoencoder)).backward()
+                self.optimize_ae.step()
+                trainLossVec.append(loss.item())
+            validLossVec = []
+            with th.no_grad():
+                for i in range(0, validX.shape[0], pretrainBatchSize):
+                    batchX = validX[i:i + pretrainBatchSize]
+                    validLossVec.append(self.autoencoder.loss(batchX).item())
+            validReverseLoss = 0.
+            buf = 'Pretrain_Epoch:{}, trainLoss:{}, validLoss:{}, ' \
+                  'validReverseLoss:{}'.format(epoch,
+                                               np.mean(trainLossVec),
+                                               np.mean(validLossVec),
+                                               validReverseLoss)
+            print(buf)
+            log.write(buf)
+
+    @instrumentation.instrument('Medgan.train')
+    def train(self,
+              dataPath='data',
+              modelPath='',
+              outPath='out',
+              nEpochs=500,
+              discriminatorTrainPeriod=2,
+              generatorTrainPeriod=1,
+              pretrainBatchSize=100,
+              batchSize=1000,
+              pretrainEpochs=100,
+              saveMaxKeep=0,
+              saveEvery=1,
+              saveBest=False,
+              validPeriod=1):
+        """
+            Train medGAN (the autoencoder is pretrained if no model is restored).
+            Logs are written to '<outPath>.log' in the background.
+
+            :param saveMaxKeep: Number of periodic checkpoints to keep. 0 to keep them all.
+            :param saveEvery: Save a checkpoint every saveEvery epochs. 0 to save the last epoch only.
+            :param saveBest: If True, keep the best model by validation AUC in '<outPath>-best'.
+            :param validPeriod: Evaluate the discriminator on the validation set every validPeriod epochs
+                                (and at the last epoch). 0 to disable.
+        """
+        trainX, validX = self.loadData(dataPath)
+        trainX, validX = self.toDevice(trainX), self.toDevice(validX)
+
+        with LogWriter(outPath + '.log') as log:
+            if modelPath == '':
+                self.pretrain(trainX, validX, log, pretrainBatchSize, pretrainEpochs)
+            else:
+                self.restore(modelPath)
+
+            nBatches = int(np.ceil(float(trainX.shape[0]) / float(batchSize)))
+            trainBatches = BatchSampler(trainX, batchSize)
+            checkpoints = CheckpointPolicy(outPath, saveEvery=saveEvery, saveMaxKeep=saveMaxKeep, saveBest=saveBest)
+            savePath = ''
+            for epoch in range(nEpochs):
+                d_loss_vec = []
+                g_loss_vec = []
+                self.autoencoder.train()
+                self.discriminator.train()
+                for i in range(nBatches):
+                    # moving averages of the generator batch norm are used when training the discriminator
+                    self.generator.eval()
+                    for _ in range(discriminatorTrainPeriod):
+                        batchX = next(trainBatches)
+                        self.optimize_d.zero_grad()
+                        discLoss = self.losses(batchX, self.randomX(len(batchX)))[0]
+                        (discLoss + self.regularization(self.discriminator)).backward()
+                        self.optimize_d.step()
+                        d_loss_vec.append(discLoss.item())
+                    self.generator.train()
+                    for _ in range(generatorTrainPeriod):
+                        self.optimize_g.zero_grad()
+                        generatorLoss = self.losses(batchX, self.randomX(len(batchX)))[1]
+                        (generatorLoss + self.regularization(self.generator, self.autoencoder.decoder)).backward()
+                        self.optimize_g.step()
+                        g_loss_vec.append(generatorLoss.item())
+
+                validAcc, validAuc = None, None
+                if validPeriod > 0 and ((epoch + 1) % validPeriod == 0 or epoch == nEpochs - 1):
+                    validAcc, validAuc = self.validate(validX, batchSize)
+                buf = 'Epoch:{}, d_loss:{}, g_loss:{}, accuracy:{}, ' \
+                      'AUC:{}'.format(epoch, np.mean(d_loss_vec),
+                                      np.mean(g_loss_vec),
+                                      validAcc,
+                                      validAuc)
+                print(buf)
+                log.write(buf)
+                savePath = checkpoints.update(self, epoch, last=epoch == nEpochs - 1,
+                                              auc=validAuc) or savePath
+        print(savePath)
+
+    def train_autoencoder(self,
+                          dataPath='data',
+                          outPath='out',
+                          pretrainBatchSize=100,
+                          pretrainEpochs=100):
+        """just train the autoencoder"""
+        trainX, validX = self.loadData(dataPath)
+        trainX, validX = self.toDevice(trainX), self.toDevice(validX)
+        with LogWriter(outPath + '.log') as log:
+            self.pretrain(trainX, validX, log, pretrainBatchSize, pretrainEpochs)
+
+
+def parse_arguments(parser):
+    parser.add_argument('--embed_size', type=int, default=128,
+                        help='The dimension size of the embedding, which '
+                             'will be generated by the generator. (default '
+                             'value: 128)')
+    parser.add_argument('--noise_size', type=int, default=128,
+                        help='The dimension size of the random noise, '
+                             'on which the generator is conditioned. ('
+                             'default value: 128)')
+    parser.add_argument('--generator_size', type=tuple, default=(128, 128),
+                        help='The dimension size of the generator. Note that '
+                             'another layer of size "--embed_size" is always '
+                             'added. (default value: (128, 128))')
+    parser.add_argument('--discriminator_size', type=tuple,
+                        default=(256, 128, 1),
+                        help='The dimension size of the discriminator. ('
+                             'default value: (256, 128, 1))')
+    parser.add_argument('--compressor_size', type=tuple, default=(),
+                        help='The dimension size of the encoder of the '
+                             'autoencoder. Note that another layer of size '
+                             '"--embed_size" is always added. Therefore this '
+                             'can be a blank tuple. (default value: ())')
+    parser.add_argument('--decompressor_size', type=tuple, default=(),
+                        help='The dimension size of the decoder of the '
+                             'autoencoder. Note that another layer, '
+                             'whose size is equal to the dimension of the '
+                             '<patient_matrix>, is always added. Therefore '
+                             'this can be a blank tuple. (default value: ())')
+    parser.add_argument('--data_type', type=str, default='binary', choices=[
+                        'binary', 'count'],
+                        help='The input data type. The <patient matrix> '
+                             'could either contain binary values or count '
+                             'values. (default value: "binary")')
+    parser.add_argument('--batchnorm_decay', type=float, default=0.99,
+                        help='Decay value for the moving average used in '
+                             'Batch Normalization. (default value: 0.99)')
+    parser.add_argument('--L2', type=float, default=0.001,
+                        help='L2 regularization coefficient for all weights. '
+                             '(default value: 0.001)')
+
+    parser.add_argument('data_file', type=str, metavar='<patient_matrix>',
+                        help='The path to the numpy matrix containing '
+                             'aggregated patient records, or to an AutoML '
+                             'directory.')
+    parser.add_argument('out_file', type=str, metavar='<out_file>',
+                        help='The path to the output models.')
+    parser.add_argument('--model_file', type=str, metavar='<model_file>',
+                        default='',
+                        help='The path to the model file, in case you want '
+                             'to continue training. (default value: '')')
+    parser.add_argument('--n_pretrain_epoch', type=int, default=100,
+                        help='The number of epochs to pre-train the '
+                             'autoencoder. (default value: 100)')
+    parser.add_argument('--n_epoch', type=int, default=1000,
+                        help='The number of epochs to train medGAN. (default '
+                             'value: 1000)')
+    parser.add_argument('--n_discriminator_update', type=int, default=2,
+                        help='The number of times to update the '
+                             'discriminator per epoch. (default value: 2)')
+    parser.add_argument('--n_generator_update', type=int, default=1,
+                        help='The number of times to update the generator '
+                             'per epoch. (default value: 1)')
+    parser.add_argument('--pretrain_batch_size', type=int, default=100,
+                        help='The size of a single mini-batch for '
+                             'pre-training the autoencoder. (default value: '
+                             '100)')
+    parser.add_argument('--batch_size', type=int, default=1000,
+                        help='The size of a single mini-batch for training '
+                             'medGAN. (default value: 1000)')
+    parser.add_argument('--save_max_keep', type=int, default=0,
+                        help='The number of models to keep. Setting this to '
+                             '0 will save models for every epoch. (default '
+                             'value: 0)')
+    parser.add_argument('--save_every', type=int, default=1,
+                        help='Save a model every N epochs. Setting this to '
+                             '0 will only save the model of the last epoch. '
+                             '(default value: 1)')
+    parser.add_argument('--save_best', action='store_true',
+                        help='Also keep the best model (validation AUC of the '
+                             'discriminator closest to 0.5) in '
+                             '"<out_file>-best".')
+    parser.add_argument('--valid_period', type=int, default=1,
+                        help='Evaluate the discriminator on the validation '
+                             'set every N epochs. Setting this to 0 disables '
+                             'the validation. (default value: 1)')
+    parser.add_argument('--n_samples', type=int, default=10000,
+                        help='The number of records to generate in generate '
+                             'mode. (default value: 10000)')
+    parser.add_argument('--burn_in', type=int, default=1000,
+                        help='The number of batches used to update the batch '
+                             'normalization statistics before generating. '
+                             'Setting this to 0 skips the burn-in. (default '
+                             'value: 1000)')
+    parser.add_argument('--generate', action='store_true',
+                        help="Activate generate mode")
+    parser.add_argument('--autoencoder', action='store_true',
+                        help="Activate autoencoder mode")
+    parser.add_argument('--device', type=str, default=None,
+                        help='The compute device, e.g. "cpu" or "cuda:0". '
+                             '(default value: cuda if available, otherwise '
+                             'cpu)')
+    parsed_args = parser.parse_args()
+    return parsed_args
+
+
+if __name__ == '__main__':
+    args = parse_arguments(argparse.ArgumentParser())
+
+    if os.path.isdir(args.data_file):
+        data = loadAutoML(args.data_file)
+        if args.data_type == 'binary':
+            # Categorical variables one-hot encoded (loadData rejects non binary columns)
+            data.process_data(norm=None, code='one-hot')
+        else:
+            # Numerical variables scaled to [0, 1], categorical variables label encoded (non negative)
+            data.process_data(norm='min-max')
+        inputDim = data.get_array('X', processed=True).shape[1]
+    else:
+        data = args.data_file
+        inputDim = np.load(args.data_file, mmap_mode='r').shape[1]
+
+    mg = Medgan(dataType=args.data_type,
+                inputDim=inputDim,
+                embeddingDim=args.embed_size,
+                randomDim=args.noise_size,
+                generatorDims=args.generator_size,
+                discriminatorDims=args.discriminator_size,
+                compressDims=args.compressor_size,
+                decompressDims=args.decompressor_size,
+                bnDecay=args.batchnorm_decay,
+                l2scale=args.L2,
+                device=args.device)
+
+    if args.autoencoder:
+        mg.train_autoencoder(dataPath=data,
+                             outPath=args.out_file,
+                             pretrainBatchSize=100,
+                             pretrainEpochs=100)
+
+    elif not args.generate:
+        mg.train(dataPath=data,
+                 modelPath=args.model_file,
+                 outPath=args.out_file,
+                 pretrainEpochs=args.n_pretrain_epoch,
+                 nEpochs=args.n_epoch,
+                 discriminatorTrainPeriod=args.n_discriminator_update,
+                 generatorTrainPeriod=args.n_generator_update,
+                 pretrainBatchSize=args.pretrain_batch_size,
+                 batchSize=args.batch_size,
+                 saveMaxKeep=args.save_max_keep,
+                 saveEvery=args.save_every,
+                 saveBest=args.save_best,
+                 validPeriod=args.valid_period)
+
+    # You must specify "--model_file" and "<out_file>" to generate synthetic
+    # data.
+    else:
+        mg.generateData(nSamples=args.n_samples,
+                        modelFile=args.model_file,
+                        batchSize=args.batch_size,
+                        outFile=args.out_file,
+                        burnIn=args.burn_in)
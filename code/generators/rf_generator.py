@@ -6,6 +6,7 @@ problem_dir = 'code/auto_ml'
 from sys import path
 path.append(problem_dir)
 from auto_ml import AutoML
+import instrumentation
 
 class RF_generator():
     def __init__(self, ds):
@@ -34,9 +35,10 @@ class RF_generator():
         self.ds.process_data(**kwargs)
     
     def get_data(self):
-        return self.ds.get_data('X', processed=True)
+        return self.ds.get_data('X', processed=True, verbose=False)
     
     
+    @instrumentation.instrument('RF_generator.fit')
     def fit(self, **kwargs):
         """ 
             Fit one random forest for each column, given the others
@@ -59,6 +61,7 @@ class RF_generator():
             self.models.append(model)
       
         
+    @instrumentation.instrument('RF_generator.generate')
     def generate(self, p=0.8):
         """ 
             Generate examples by copying data and then do values imputations
@@ -82,6 +85,7 @@ class RF_generator():
         return self.gen_data
     
 
+    @instrumentation.instrument('RF_generator.partial_fit_generate')
     def partial_fit_generate(self, p=0.8, **kwargs):
         """
             Fit and generate for high dimensional case.
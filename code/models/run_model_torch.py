@@ -25,30 +25,74 @@ def get_loader(X_train, y_train, X_test, y_test):
     test_loader = data_utils.DataLoader(test, batch_size=12, shuffle=False)
     return train_loader, test_loader
 
-def training(X_train, y_train, X_test, y_test):
-    net, criterion, optimizer = get_NN(X_train.shape[1])
-    losses = []
-    train_accuracy = []
-    test_accuracy = []
-    for epoch in range(10):
-        running_loss = 0.0
-        train_loader, _ = get_loader(X_train, y_train, X_test, y_test)
-        for i, (samples, labels) in enumerate(train_loader):
-            net.zero_grad()
-            input = torch.Tensor(samples)
-            target = torch.Tensor(labels)
-            output = net(input)
-            loss = criterion(output, target)
-            loss.backward()
-            optimizer.step()
-            running_loss += loss.item()
-        y_pred_train = np.round(net(torch.Tensor(X_train)).data.numpy())
-        y_pred_test = np.round(net(torch.Tensor(X_test)).data.numpy())
-        #print('epoch %d : loss=%.4f, acc=%.4f, val_acc=%.4f' % (epoch+1, 
-        #                                            running_loss / len(train_loader),
-        #                                            accuracy_score(y_train, y_pred_train), 
-        #                                            accuracy_score(y_test, y_pred_test)))
-        losses += [running_loss / len(train_loader)]
-        train_accuracy += [accuracy_score(y_train, y_pred_train)]
-        test_accuracy += [accuracy_score(y_test, y_pred_test)]
-    return losses, train_accuracy, test_accuracy
\ No newline at end of file
+class Trainer():
+    def __init__(self, X_train, y_train, X_test, y_test, batch_size=12, eval_every=1, device='cpu'):
+        """
+            Train the network of get_NN.
+            Data is converted once to contiguous float tensors (pinned if CUDA is available,
+            for faster transfers) and batches are drawn with an index permutation.
+
+            :param batch_size: Size of the batches
+            :param eval_every: Accuracies are computed every eval_every epochs (and at the last epoch)
+            :param device: Device of the network
+        """
+        self.device = torch.device(device)
+        self.batch_size = batch_size
+        self.eval_every = eval_every
+        self.X_train, self.y_train = self.to_tensor(X_train), self.to_tensor(y_train).view(len(y_train), -1)
+        self.X_test, self.y_test = self.to_tensor(X_test), self.to_tensor(y_test).view(len(y_test), -1)
+        self.net, self.criterion, self.optimizer = get_NN(X_train.shape[1])
+        self.net.to(self.device)
+
+    @staticmethod
+    def to_tensor(X):
+        X = torch.from_numpy(np.ascontiguousarray(X, dtype=np.float32))
+        if torch.cuda.is_available():
+            X = X.pin_memory()
+        return X
+
+    def predict(self, X):
+        """ Predictions of the network (evaluation mode, without gradients), by batches of 4096 rows.
+        """
+        self.net.eval()
+        with torch.no_grad():
+            y_pred = torch.cat([self.net(X[i:i + 4096].to(self.device, non_blocking=True)).cpu()
+                                for i in range(0, len(X), 4096)])
+        self.net.train()
+        return y_pred
+
+    def accuracy(self, X, y):
+        return (torch.round(self.predict(X)) == y).float().mean().item()
+
+    def fit(self, epochs=10):
+        """
+            :return: Loss of each epoch, train and test accuracies of each evaluated epoch
+            :rtype: Tuple
+        """
+        losses = []
+        train_accuracy = []
+        test_accuracy = []
+        n_batches = int(np.ceil(len(self.X_train) / self.batch_size))
+        self.net.train()
+        for epoch in range(epochs):
+            running_loss = 0.0
+            permutation = torch.randperm(len(self.X_train))
+            for i in range(n_batches):
+                idx = permutation[i * self.batch_size:(i + 1) * self.batch_size]
+                input = self.X_train.index_select(0, idx).to(self.device, non_blocking=True)
+                target = self.y_train.index_select(0, idx).to(self.device, non_blocking=True)
+                self.net.zero_grad()
+                output = self.net(input)
+                loss = self.criterion(output, target)
+                loss.backward()
+                self.optimizer.step()
+                running_loss += loss.item()
+            #print('epoch %d : loss=%.4f' % (epoch+1, running_loss / n_batches))
+            losses += [running_loss / n_batches]
+            if (epoch + 1) % self.eval_every == 0 or epoch == epochs - 1:
+                train_accuracy += [self.accuracy(self.X_train, self.y_train)]
+                test_accuracy += [self.accuracy(self.X_test, self.y_test)]
+        return losses, train_accuracy, test_accuracy
+
+def training(X_train, y_train, X_test, y_test, epochs=10, eval_every=1):
+    return Trainer(X_train, y_train, X_test, y_test, eval_every=eval_every).fit(epochs)
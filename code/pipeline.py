@@ -0,0 +1,280 @@
+# Command line batch pipeline: load -> generate -> export -> compare.
+# A generator is fitted once on a source AutoML dataset, then N synthetic datasets are generated,
+# saved in AutoML format (features and targets, in the space of the source data) and scored with the Comparator.
+# Generation and scoring run in separate threads connected by a bounded queue,
+# so that the generation of dataset k+1 overlaps the scoring of dataset k.
+#
+# Usage (from the repository root):
+#   python code/pipeline.py data/iris iris --generator copula --n 10 --output_dir out
+
+# Imports
+import os
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+import traceback
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.abspath(os.path.dirname(__file__))
+for problem_dir in ['auto_ml', 'processing', 'functions', 'models', 'generators']:
+    if os.path.join(ROOT, problem_dir) not in sys.path:
+        sys.path.append(os.path.join(ROOT, problem_dir))
+
+from auto_ml import AutoML
+from comparator import Comparator
+import instrumentation
+
+# End of the queue
+_DONE = None
+
+# Column of the class indexes of one-hot targets, while generating
+TARGET = '_class'
+
+
+class Generator():
+    def __init__(self, ds, name='copula', seed=0, **kwargs):
+        """
+            Generator fitted once on a dataset, sampled many times.
+
+            :param ds: AutoML object of the source data (used by the generator only).
+                       The generator works on its processed data, see impute.
+            :param name: 'rf', 'copula' or 'sam'
+            :param seed: Seed of the first generated dataset (the k-th dataset uses seed + k)
+            :param kwargs: Parameters of the generator (p, method, epochs, test_epochs)
+        """
+        if name not in ['rf', 'copula', 'sam']:
+            raise ValueError('Argument name is invalid.')
+        self.ds = ds
+        self.name = name
+        self.seed = seed
+        self.kwargs = kwargs
+        self.model = None
+        # Mean and standard deviation of the numerical variables ('sam' only)
+        self.scale = None
+
+    def get_data(self):
+        """ Features and targets of the source, one-hot targets merged in a single column (see merge_targets). """
+        return merge_targets(self.ds.get_data(processed=True, verbose=False), self.ds.subsets.get('y', []))
+
+    @instrumentation.instrument('pipeline.fit')
+    def fit(self):
+        if self.name == 'rf':
+            from rf_generator import RF_generator
+            self.model = RF_generator(self.ds)
+            # RF_generator processes the data: back to the raw values
+            impute(self.ds)
+            self.model.fit()
+        elif self.name == 'copula':
+            from copula_generator import CopulaGenerator
+            self.model = CopulaGenerator(method=self.kwargs.get('method', 'gaussian'))
+            self.model.fit(self.get_data())
+        else:
+            from csam import SAM
+            data = self.get_data()
+            # Targets are categorical, except in regression
+            categorical_variables = [t != 'Numerical' for t in self.ds.feat_type] + \
+                                    [column == TARGET or self.ds.info.get('task') != 'regression'
+                                     for column in data.columns[len(self.ds.feat_type):]]
+            # SAM is trained on standardized numerical variables, mapped back after the generation
+            numerical = data.columns[[not c for c in categorical_variables]]
+            self.scale = data[numerical].mean(), data[numerical].std().replace(0, 1)
+            data[numerical] = (data[numerical] - self.scale[0]) / self.scale[1]
+            self.model = SAM(train_epochs=self.kwargs.get('epochs', 1000),
+                             test_epochs=self.kwargs.get('test_epochs', 1000))
+            self.model.run_SAM(data, categorical_variables=categorical_variables, verbose=False)
+        return self
+
+    @instrumentation.instrument('pipeline.generate')
+    def generate(self, k):
+        """ Generate the k-th synthetic dataset (same number of rows and columns as the source, targets included). """
+        n = len(self.ds.get_data(processed=True, verbose=False))
+        if self.name == 'rf':
+            np.random.seed(self.seed + k)
+            # Each dataset is imputed from the source data (features only, the targets are copied)
+            self.model.gen_data = self.ds.get_data(processed=True, verbose=False).copy()
+            return self.model.generate(p=self.kwargs.get('p', 0.8)).copy()
+        elif self.name == 'copula':
+            data = self.model.sample(n, random_state=self.seed + k)
+        else:
+            data = pd.concat(self.model.generate_batches(n, batch_size=10000, seed=self.seed + k))
+            mean, std = self.scale
+            data[mean.index] = data[mean.index] * std + mean
+        return split_targets(data, self.ds.subsets.get('y', []))
+
+
+def generate_all(generator, n, output, errors):
+    """ Producer: generate n datasets and put them in the output queue (blocks when the queue is full). """
+    try:
+        for k in range(n):
+            start = time.time()
+            X = generator.generate(k)
+            print('[generate] dataset {} in {:.2f}s'.format(k, time.time() - start))
+            output.put((k, X))
+    except Exception:
+        errors.append(traceback.format_exc())
+    finally:
+        output.put(_DONE)
+
+
+def impute(ds):
+    """
+        Set the processed data of ds to its raw data with imputed missing values (no encoding nor normalization),
+        so that the generated datasets are in the space of the source data.
+
+        :param ds: AutoML object
+        :return: ds
+    """
+    ds.processed_data = ds.data.copy()
+    ds.imputation()
+    return ds
+
+
+def merge_targets(data, y_columns):
+    """
+        Replace one-hot targets (one 0/1 column per class) by a single column of class indexes,
+        so that the generators produce valid classes. Other targets are kept as they are.
+
+        :param data: Features and targets
+        :param y_columns: Names of the target columns
+        :return: Data
+        :rtype: pd.DataFrame
+    """
+    y = data[y_columns]
+    if len(y_columns) > 1 and y.isin([0, 1]).all().all() and (y.sum(axis=1) == 1).all():
+        data = data.drop(y_columns, axis=1)
+        data[TARGET] = y.values.argmax(axis=1)
+    return data
+
+
+def split_targets(data, y_columns):
+    """ Inverse of merge_targets. """
+    if TARGET not in data.columns:
+        return data
+    classes = data[TARGET].astype(int).values
+    y = pd.DataFrame(np.eye(len(y_columns))[classes], columns=y_columns, index=data.index)
+    return pd.concat([data.drop(TARGET, axis=1), y], axis=1)
+
+
+@instrumentation.instrument('pipeline.export')
+def export(data, output_dir, basename, source):
+    """ Save a generated dataset in AutoML format: features and targets, with the column names of the source. """
+    data = data.reset_index(drop=True)
+    y = data[source.subsets['y']] if 'y' in source.subsets else None
+    return AutoML.from_df(output_dir, basename, data[source.subsets['X']], y=y)
+
+
+@instrumentation.instrument('pipeline.compare')
+def compare(reference, ds):
+    """
+        Comparator scores: discriminator accuracy (0.5 is best) and mean distance between descriptors.
+        Both datasets are in the space of the source data, the Comparator processes them in the same way.
+    """
+    comparator = Comparator(reference, ds)
+    return {'discriminator_accuracy': float(comparator.classify()),
+            'descriptors_distance': float(np.nanmean(list(comparator.descriptors_dist.values())))}
+
+
+def run(input_dir, basename, generator='copula', n=1, output_dir='output', queue_size=2, seed=0, **kwargs):
+    """
+        Run the pipeline.
+
+        :param input_dir: The directory of the source AutoML dataset
+        :param basename: The name of the source dataset
+        :param generator: 'rf', 'copula' or 'sam'
+        :param n: Number of synthetic datasets
+        :param output_dir: The directory of the generated AutoML datasets (and of the reference, the source data)
+        :param queue_size: Number of generated datasets waiting to be scored (memory bound)
+        :param seed: Seed of the first generated dataset
+        :param kwargs: Parameters of the generator
+        :return: Scores and timings of each generated dataset
+        :rtype: list
+    """
+    start = time.time()
+    # The generator and the comparator work on their own copies of the source data.
+    # The reference is saved as the generated datasets are (same train/test split sizes for the Comparator)
+    source = impute(AutoML(input_dir, basename))
+    reference = export(source.data, output_dir, '{}_reference'.format(basename), source)
+    print('[load] {} ({} rows) in {:.2f}s'.format(basename, len(source.get_data()), time.time() - start))
+
+    start = time.time()
+    model = Generator(source, name=generator, seed=seed, **kwargs).fit()
+    print('[fit] {} in {:.2f}s'.format(generator, time.time() - start))
+
+    generated = queue.Queue(maxsize=queue_size)
+    errors = []
+    producer = threading.Thread(target=generate_all, args=(model, n, generated, errors), daemon=True)
+    producer.start()
+
+    results = []
+    while True:
+        item = generated.get()
+        if item is _DONE:
+            break
+        k, X = item
+        name = '{}_{}_{}'.format(basename, generator, k)
+        start = time.time()
+        ds = export(X, output_dir, name, source)
+        export_time = time.time() - start
+        start = time.time()
+        try:
+            scores = compare(reference, ds)
+        except Exception:
+            scores = {'error': traceback.format_exc(limit=3)}
+        results.append(dict(scores, dataset=name, export_time=export_time, compare_time=time.time() - start))
+        print('[compare] {} in {:.2f}s: {}'.format(name, results[-1]['compare_time'],
+                                                   ', '.join('{}={:.4f}'.format(key, value) for key, value in scores.items()
+                                                             if isinstance(value, float)) or 'error'))
+    producer.join()
+    if errors:
+        raise RuntimeError('Generation failed:\n' + errors[0])
+    return results
+
+
+def parse_arguments(parser):
+    parser.add_argument('input_dir', help='The directory of the source AutoML dataset.')
+    parser.add_argument('basename', help='The name of the source dataset.')
+    parser.add_argument('--generator', default='copula', choices=['rf', 'copula', 'sam'],
+                        help='Generator. (default: copula)')
+    parser.add_argument('--n', type=int, default=1,
+                        help='Number of synthetic datasets. (default: 1)')
+    parser.add_argument('--output_dir', default='output',
+                        help='The directory of the generated AutoML datasets and of the scores. (default: output)')
+    parser.add_argument('--queue_size', type=int, default=2,
+                        help='Number of generated datasets waiting to be scored. (default: 2)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the first generated dataset. (default: 0)')
+    parser.add_argument('--p', type=float, default=0.8,
+                        help='rf: probability of replacing a value. (default: 0.8)')
+    parser.add_argument('--method', default='gaussian', choices=['gaussian', 'kde'],
+                        help='copula: latent model. (default: gaussian)')
+    parser.add_argument('--epochs', type=int, default=1000,
+                        help='sam: training epochs. (default: 1000)')
+    parser.add_argument('--test_epochs', type=int, default=1000,
+                        help='sam: test epochs. (default: 1000)')
+    parser.add_argument('--profile', action='store_true',
+                        help='Print the time spent in each stage (instrumentation).')
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_arguments(argparse.ArgumentParser())
+    if args.profile:
+        instrumentation.enable()
+
+    start = time.time()
+    results = run(args.input_dir, args.basename, generator=args.generator, n=args.n, output_dir=args.output_dir,
+                  queue_size=args.queue_size, seed=args.seed, p=args.p, method=args.method,
+                  epochs=args.epochs, test_epochs=args.test_epochs)
+
+    if not os.path.isdir(args.output_dir):
+        os.makedirs(args.output_dir)
+    with open(os.path.join(args.output_dir, '{}_{}_scores.json'.format(args.basename, args.generator)), 'w') as f:
+        json.dump(results, f, indent=2)
+    print('[done] {} datasets in {:.2f}s'.format(len(results), time.time() - start))
+
+    if args.profile:
+        print(instrumentation.flame())